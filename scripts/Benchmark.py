@@ -0,0 +1,263 @@
+import argparse
+import fnmatch
+import gc
+import importlib
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import namedtuple
+
+from synthetic_gear import generate_cohort
+from utils import *
+
+# A benchmark: its name and a function that prepares its inputs and returns the function timed.
+Benchmark = namedtuple("Benchmark", ["name", "setup"])
+
+FIGURE_MODULES = ["Fig2A", "Fig2B", "Fig2C", "Fig2D", "Fig2E"]
+
+
+def read_files_setup(module_name, function_name, directory, **kwargs):
+    '''
+    Return the setup of a benchmark that parses every GEAR output of a directory, kwargs are passed to the parser.
+    '''
+    def setup(cohort, work_dir):
+        module = importlib.import_module(module_name)
+        read = getattr(module, function_name)
+        file_list = [g.path for g in find_gear_files(os.path.join(cohort, directory))]
+        return lambda: [read(path, **kwargs) for path in file_list]
+    return setup
+
+
+def calculate_ratio_setup(cohort, work_dir):
+    '''
+    Build the control / treatment table of the synthetic motif counts, only the ratios are timed.
+    '''
+    import numpy as np
+    import pandas as pd
+    import MotifCountAnalysis as motif_count
+    from manifest import load_manifest
+
+    qv = 35
+    input_path = os.path.join(cohort, "GEAR_MOTIF_COUNT")
+    manifest = load_manifest(os.path.join(cohort, "manifest.tsv"), input_path)
+    category_map = manifest["category"].to_dict()
+    sequence_size_map = manifest["reads"].to_dict()
+    read_factor_map = {k: v / np.min(list(sequence_size_map.values())) for k, v in sequence_size_map.items()}
+    df = motif_count.concat_motif_counts(
+        [motif_count.process_file(g, qv, category_map, sequence_size_map, read_factor_map, motif_count.REGION_MAP)
+         for g in find_gear_files(input_path)])
+    df_total = df.query("motif_type == 'TTAGGG'").groupby("sample_id", observed=True)[qv].sum()
+    df = pd.merge(df, df_total.reset_index().rename(columns={qv: "TTAGGG_total"}), on="sample_id", how="left")
+    df_control_treatment = motif_count.control_treatment_table(df)
+    return lambda: motif_count.calculate_ratio(df_control_treatment)
+
+
+def parse_cs_setup(cohort, work_dir):
+    '''
+    Decode the cs strings of the synthetic telomere mutation outputs, only their tokenisation is timed.
+    '''
+    from cs_string import parse_cs
+    from gear_io import read_gear_json
+    strings = [read["cs_str"] for g in find_gear_files(os.path.join(cohort, "GEAR_TELOMERE_MUTATION"))
+               for read in read_gear_json(g.path)]
+    return lambda: parse_cs(strings)
+
+
+def figure_setup(name):
+    '''
+    Return the setup of a benchmark that renders a figure from the bundled tables.
+    '''
+    def setup(cohort, work_dir):
+        from figure_runner import import_plotting, render_figure
+        import_plotting()
+        module = importlib.import_module(name)
+        args = argparse.Namespace(output=os.path.join(work_dir, os.path.basename(module.OUTPUT)))
+        return lambda: render_figure(module.render, args)
+    return setup
+
+
+BENCHMARKS = [Benchmark("read_gear_motif_count",
+                        read_files_setup("MotifCountAnalysis", "read_gear_motif_count", "GEAR_MOTIF_COUNT")),
+              Benchmark("read_gear_vca", read_files_setup("VariantCallAnalysis", "read_gear_vca", "GEAR_VCA")),
+              Benchmark("read_gear_mutations", read_files_setup("TelomereLengthAndMutationsAnalysis",
+                                                                "read_gear_mutations", "GEAR_TELOMERE_MUTATION")),
+              Benchmark("read_gear_telomere_summary", read_files_setup(
+                  "TelomereLengthAndMutationsAnalysis", "read_gear_telomere_summary", "GEAR_TELOMERE_MUTATION")),
+              Benchmark("read_gear_error_profile", read_files_setup(
+                  "TelomereLengthAndMutationsAnalysis", "read_gear_error_profile", "GEAR_TELOMERE_MUTATION")),
+              Benchmark("read_gear_reads", read_files_setup(
+                  "TelomereLengthAndMutationsAnalysis", "read_gear_reads", "GEAR_TELOMERE_MUTATION", packed=True)),
+              Benchmark("parse_cs", parse_cs_setup),
+              Benchmark("calculate_ratio", calculate_ratio_setup)] + \
+             [Benchmark("figure_" + name, figure_setup(name)) for name in FIGURE_MODULES]
+
+
+def measure(func, repeat=3):
+    '''
+    Time a function and measure its peak memory.
+
+    The function runs repeat times without memory tracing, then once more under tracemalloc,
+    which slows it down, to get the peak of the memory allocated by Python.
+
+    Returns
+    -------
+    dict
+        the wall and CPU times of each run in seconds and the peak traced memory in MB.
+    '''
+    wall, cpu = list(), list()
+    for _ in range(repeat):
+        gc.collect()
+        start_wall, start_cpu = time.perf_counter(), time.process_time()
+        func()
+        wall.append(time.perf_counter() - start_wall)
+        cpu.append(time.process_time() - start_cpu)
+
+    gc.collect()
+    tracemalloc.start()
+    try:
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {"wall": wall, "cpu": cpu, "wall_min": min(wall), "wall_median": statistics.median(wall),
+            "cpu_median": statistics.median(cpu), "peak_memory_mb": peak / 1e6}
+
+
+def code_version():
+    '''
+    Return the git commit of the scripts, with a -dirty suffix if they have local changes, None outside git.
+    '''
+    try:
+        commit = subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], stderr=subprocess.DEVNULL,
+                                         universal_newlines=True).strip()
+        dirty = subprocess.call(["git", "diff", "--quiet", "HEAD", "--", "."], stderr=subprocess.DEVNULL) != 0
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return commit + ("-dirty" if dirty else "")
+
+
+def environment():
+    import numpy as np
+    import pandas as pd
+    return {"python": platform.python_version(), "numpy": np.__version__, "pandas": pd.__version__,
+            "machine": platform.machine(), "cpus": os.cpu_count()}
+
+
+def load_results(results_file):
+    results = list()
+    if file_exists(results_file):
+        with open(results_file) as f:
+            results = [json.loads(line) for line in f if line.strip()]
+    return results
+
+
+def compare(result, baseline):
+    '''
+    Log the median time of a result relative to the latest baseline run of the same benchmark and parameters.
+    '''
+    previous = [b for b in baseline if b["benchmark"] == result["benchmark"] and b["params"] == result["params"]]
+    if len(previous) == 0:
+        logging.info("%-24s no baseline", result["benchmark"])
+        return
+    previous = previous[-1]
+    logging.info("%-24s %.3f s vs %.3f s (%s): x%.2f", result["benchmark"], result["wall_median"],
+                 previous["wall_median"], previous.get("version"), result["wall_median"] / previous["wall_median"])
+
+
+if __name__ == "__main__":
+
+    # store start time for benchmarking
+    start_time = time.time()
+
+    # setup logger
+    root_logger, log_formatter = get_cmri_logger()
+
+    # setup arguments
+    parser = argparse.ArgumentParser(description='Benchmark the parsers, the ratio computation and the figures on '
+                                                 'a synthetic cohort', epilog=epilog_text,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
+    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
+    parser.add_argument('-o', '--output', type=str, help='Results file, one json line per benchmark is appended',
+                        default="../benchmarks/results.jsonl")
+    parser.add_argument('-b', '--benchmark', type=str, help='Run only the benchmarks matching this pattern (e.g. '
+                                                            'read_*)', default="*")
+    parser.add_argument('--baseline', type=str, help='Results file to compare the timings with', default=None)
+    parser.add_argument('--repeat', type=int, help='Number of timed runs of each benchmark', default=3)
+    parser.add_argument('--work_dir', type=str, help='Directory of the synthetic cohort and the figures, a '
+                                                     'temporary directory by default', default=None)
+    parser.add_argument('--keep', action='store_true', help='Keep the temporary directory')
+    parser.add_argument('--samples', type=int, help='Number of samples of the synthetic cohort', default=4)
+    parser.add_argument('--lanes', type=int, help='Number of lanes of each sample', default=2)
+    parser.add_argument('--chromosomes', type=int, help='Number of chromosomes', default=24)
+    parser.add_argument('--regions', type=int, help='Number of regions of each chromosome', default=3)
+    parser.add_argument('--motifs', type=int, help='Number of motifs counted in each region', default=38)
+    parser.add_argument('--reads', type=int, help='Number of reads of each telomere mutation output',
+                        default=20000)
+    parser.add_argument('--seed', type=int, help='Random seed of the synthetic cohort', default=0)
+
+    # parse arguments and set logger
+    args = parser.parse_args()
+    consoleHandler = logging.StreamHandler(sys.stdout)
+
+    if args.debug:
+        root_logger.setLevel(logging.DEBUG)
+
+    if args.silent:
+        consoleHandler.setLevel(logging.ERROR)
+
+    consoleHandler.setFormatter(log_formatter)
+    root_logger.addHandler(consoleHandler)
+
+    print_cmri_welcome("Benchmark")
+
+    selected = [b for b in BENCHMARKS if fnmatch.fnmatch(b.name, args.benchmark)]
+    if len(selected) == 0:
+        logging.error("No benchmark matches %s, the benchmarks are: %s", args.benchmark,
+                      ", ".join(b.name for b in BENCHMARKS))
+        exit(errno.EINVAL)
+
+    baseline = None
+    if args.baseline is not None:
+        file_exists(args.baseline, True)
+        baseline = load_results(args.baseline)
+
+    params = {"samples": args.samples, "lanes": args.lanes, "chromosomes": args.chromosomes,
+              "regions": args.regions, "motifs": args.motifs, "reads": args.reads, "seed": args.seed}
+    work_dir = args.work_dir if args.work_dir is not None else tempfile.mkdtemp(prefix="gear_benchmark_")
+    os.makedirs(work_dir, exist_ok=True)
+    cohort = os.path.join(work_dir, "cohort")
+    output_dir = os.path.dirname(args.output)
+    if output_dir != "":
+        os.makedirs(output_dir, exist_ok=True)
+
+    try:
+        logging.info("Generating the synthetic cohort in %s: %s", cohort, params)
+        generate_cohort(cohort, **params)
+
+        version = code_version()
+        context = environment()
+        for benchmark in selected:
+            func = benchmark.setup(cohort, work_dir)
+            result = {"benchmark": benchmark.name, "params": params, "version": version,
+                      "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "repeat": args.repeat}
+            result.update(measure(func, args.repeat))
+            result["max_rss_mb"] = peak_rss_mb()
+            result.update(context)
+            logging.info("%-24s median %.3f s, min %.3f s, peak %.1f MB", benchmark.name, result["wall_median"],
+                         result["wall_min"], result["peak_memory_mb"])
+            if baseline is not None:
+                compare(result, baseline)
+            with open(args.output, "a") as f:
+                f.write(json.dumps(result, sort_keys=True) + "\n")
+        logging.info("Results saved: %s", args.output)
+    finally:
+        if args.work_dir is None and not args.keep:
+            shutil.rmtree(work_dir, ignore_errors=True)
+
+    logging.info("Total computation time: %.1f s", time.time() - start_time)
@@ -0,0 +1,152 @@
+import argparse
+import sys
+import time
+import numpy as np
+import pandas as pd
+
+from table_store import *
+from utils import *
+
+# resamples of each bar and confidence level, as the seaborn bar plots
+N_BOOT = 1000
+CI_LEVEL = 95
+# fixed seed, the intervals are the same on every run
+SEED = 0
+
+# columns of the interval tables, after the columns of the bars
+INTERVAL_COLUMNS = ["mean", "ci_low", "ci_high", "n"]
+
+
+def bootstrap_intervals(df, by, value, n_boot=N_BOOT, ci=CI_LEVEL, seed=SEED):
+    '''
+    Compute the mean and the percentile bootstrap confidence interval of the mean of every group at once.
+
+    A single (n_boot, largest group) matrix of random numbers is drawn and reused by all the
+    groups: the resample b of a group with n values takes its values at floor(u[b, :n] * n).
+    The resampled means of all the groups are then sums over one gathered matrix.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        the values, one row per observation.
+    by : list
+        the columns of the bars.
+    value : str
+        the column of the values, the missing values are ignored.
+    n_boot : int
+        number of resamples.
+    ci : float
+        confidence level, in percent.
+    seed : int
+        seed of the random numbers.
+
+    Returns
+    -------
+    pandas.DataFrame
+        one row per bar with its mean, the bounds of its interval (NaN for the bars with a
+        single value) and its number of values.
+    '''
+    df = df.dropna(subset=[value])
+    grouped = df.groupby(by, observed=True, sort=True)
+    group = grouped.ngroup().to_numpy()
+    order = np.argsort(group, kind="stable")
+    group = group[order]
+    values = df[value].to_numpy(dtype=float)[order]
+    sizes = np.bincount(group, minlength=grouped.ngroups)
+    offsets = np.cumsum(sizes) - sizes
+
+    with Stage("bootstrap", rows=len(sizes)):
+        rng = np.random.default_rng(seed)
+        draws = rng.random((n_boot, sizes.max() if len(sizes) > 0 else 0))
+        position = np.arange(len(values)) - offsets[group]
+        index = offsets[group] + (draws[:, position] * sizes[group]).astype(np.int64)
+        means = np.add.reduceat(values[index], offsets, axis=1) / sizes if len(values) > 0 else \
+            np.zeros((n_boot, 0))
+        low, high = np.percentile(means, [(100 - ci) / 2, 100 - (100 - ci) / 2], axis=0)
+
+    df_ci = grouped[value].mean().reset_index(name="mean")
+    df_ci["ci_low"] = np.where(sizes > 1, low, np.nan)
+    df_ci["ci_high"] = np.where(sizes > 1, high, np.nan)
+    df_ci["n"] = sizes
+    return df_ci
+
+
+def ratio_intervals(df_ratio, **kwargs):
+    '''
+    Intervals of the mean control / treatment ratio of each motif and region (Fig 2E).
+    '''
+    return bootstrap_intervals(df_ratio, ["motif_type", "motif_group", "region"], "value", **kwargs)
+
+
+def mutation_count_intervals(df_mutation_count, **kwargs):
+    '''
+    Intervals of the mean motif count per Mbp of the samples of each category, by motif and region (Fig 2D).
+    '''
+    df = df_mutation_count.groupby(["sample_id", "motif_type", "category", "region"], observed=True)[
+        "per_Mbp"].sum().reset_index()
+    return bootstrap_intervals(df, ["motif_type", "category", "region"], "per_Mbp", **kwargs)
+
+
+def contribution_intervals(df_signature_contribution, **kwargs):
+    '''
+    Intervals of the mean contribution of each aetiology to the samples with a contribution, by signature type (Fig 2B).
+    '''
+    df = df_signature_contribution.groupby(["group", "metric", "aetiology"])["contribution"].sum().reset_index()
+    return bootstrap_intervals(df.query("contribution > 0"), ["metric", "aetiology"], "contribution", **kwargs)
+
+
+# interval tables saved next to the tables of the bars
+INTERVALS = {"df_ratio": ratio_intervals,
+             "df_mutation_count": mutation_count_intervals,
+             "df_signature_contribution": contribution_intervals}
+
+
+if __name__ == "__main__":
+
+    # store start time for benchmarking
+    start_time = pd.to_datetime(time.time(), unit="s")
+
+    # setup logger
+    root_logger, log_formatter = get_cmri_logger()
+
+    # setup arguments
+    parser = argparse.ArgumentParser(description='Compute the bootstrap confidence intervals of the bar plots',
+                                     epilog=epilog_text, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
+    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
+    parser.add_argument('-o', '--output', type=str, help='Output directory', default="../data/")
+    parser.add_argument('-i', '--input', type=str, help='Input directory', default="../data/")
+    parser.add_argument('-n', '--n_boot', type=int, help='Number of bootstrap resamples', default=N_BOOT)
+    parser.add_argument('--ci', type=float, help='Confidence level (%%)', default=CI_LEVEL)
+    parser.add_argument('--seed', type=int, help='Random seed', default=SEED)
+    add_format_argument(parser)
+    add_trace_argument(parser)
+
+    # parse arguments and set logger
+    args = parser.parse_args()
+    consoleHandler = logging.StreamHandler(sys.stdout)
+
+    if args.debug:
+        root_logger.setLevel(logging.DEBUG)
+
+    if args.silent:
+        consoleHandler.setLevel(logging.ERROR)
+
+    consoleHandler.setFormatter(log_formatter)
+    root_logger.addHandler(consoleHandler)
+
+    print_cmri_welcome("Bootstrap Intervals")
+
+    directory_exists(args.input, True)
+    # the input tables are read in the format of the outputs when they are saved in several formats
+    set_table_format(args.format)
+
+    for name, intervals in INTERVALS.items():
+        df = read_table(os.path.join(args.input, name))
+        df_ci = intervals(df, n_boot=args.n_boot, ci=args.ci, seed=args.seed)
+        file_name = write_table(df_ci, os.path.join(args.output, name + "_ci"), args.format)
+        logging.info("Saved table - %s (%d bars)", file_name, len(df_ci))
+
+    report_stages(args.trace)
+
+    logging.info("Total computation time: %s", str(pd.to_datetime(time.time(), unit="s") - start_time))
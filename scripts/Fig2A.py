@@ -1,41 +1,21 @@
-import argparse
-import sys
-import time
-import pandas as pd
-import numpy as np
-import seaborn as sns
-import matplotlib.pyplot as plt
+from figure_runner import run_figure
 from utils import *
 
-if __name__ == "__main__":
-
-    # store start time for benchmarking
-    start_time = pd.to_datetime(time.time(), unit="s")
-
-    # setup logger
-    root_logger, log_formatter = get_cmri_logger()
-
-    # setup arguments
-    parser = argparse.ArgumentParser(description='region indexer for unknown chromosomes', epilog=epilog_text,
-                                     formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
-    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
-    parser.add_argument('-o', '--output', type=str, help='Output file', default="../figures/fig2A.pdf")
-
-    # parse arguments and set logger
-    args = parser.parse_args()
-    consoleHandler = logging.StreamHandler(sys.stdout)
+FIGURE = "Fig 2A"
+OUTPUT = "../figures/fig2A.pdf"
+# input tables and the columns read from them (None reads all)
+TABLES = {"../data/df_signature_contribution": None}
 
-    if args.debug:
-        root_logger.setLevel(logging.DEBUG)
 
-    if args.silent:
-        consoleHandler.setLevel(logging.ERROR)
-
-    consoleHandler.setFormatter(log_formatter)
-    root_logger.addHandler(consoleHandler)
-
-    print_cmri_welcome("Fig 2A")
+def render(args):
+    '''
+    Draw Fig 2A and save it to args.output.
+    '''
+    import pandas as pd
+    import numpy as np
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    from table_store import read_table
 
     aetiology_map = {'Ultraviolet light exposure': np.nan,
                      'Aristolochic acid exposure': np.nan,
@@ -59,7 +39,7 @@ if __name__ == "__main__":
     plt.rc('ytick', labelsize=20)  # fontsize of the y tick labels
     fig, ax = plt.subplots(figsize=(15, 8))
 
-    df_signature_contribution = pd.read_csv("../data/df_signature_contribution.csv",index_col=0)
+    df_signature_contribution = read_table("../data/df_signature_contribution")
     df_comb_sum = df_signature_contribution.groupby(["aetiology", "metric"])["contribution"].sum().reset_index()
     df_comb_sum = pd.pivot_table(df_comb_sum, index=["aetiology"], columns="metric").fillna(0).sum(axis=1)
     df_comb_sum = df_comb_sum / df_comb_sum.sum()
@@ -88,7 +68,11 @@ if __name__ == "__main__":
     ax.spines['left'].set_color('0')
     ax.grid(False)
 
-    plt.savefig(args.output, format="pdf", bbox_inches='tight', pad_inches=0.25)
+    with Stage("figure save"):
+        plt.savefig(args.output, format="pdf", bbox_inches='tight', pad_inches=0.25)
 
     logging.info("Saved figure - %s", args.output)
-    logging.info("Total computation time: %s", str(pd.to_datetime(time.time(), unit="s") - start_time))
\ No newline at end of file
+
+
+if __name__ == "__main__":
+    run_figure(FIGURE, OUTPUT, render)
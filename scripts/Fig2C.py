@@ -1,47 +1,33 @@
-import argparse
-import os.path
-import sys
-import time
-import pandas as pd
-import matplotlib.transforms as transforms
-import seaborn as sns
-import matplotlib.pyplot as plt
+from figure_runner import run_figure
 from utils import *
 
-if __name__ == "__main__":
-
-    # store start time for benchmarking
-    start_time = pd.to_datetime(time.time(), unit="s")
-
-    # setup logger
-    root_logger, log_formatter = get_cmri_logger()
+FIGURE = "Fig 2C"
+OUTPUT = "../figures/fig2C.pdf"
+# input tables and the columns read from them (None reads all)
+TABLES = {"../data/df_snp": None, "../data/df_dnp": None, "../data/df_indels": None}
 
-    # setup arguments
-    parser = argparse.ArgumentParser(description='region indexer for unknown chromosomes', epilog=epilog_text,
-                                     formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
-    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
-    parser.add_argument('-o', '--output', type=str, help='Output file', default="../figures/fig2C.pdf")
 
-    # parse arguments and set logger
-    args = parser.parse_args()
-    consoleHandler = logging.StreamHandler(sys.stdout)
+def output_files(output):
+    '''
+    Return the files saved by render, one per panel.
+    '''
+    root_file_name = os.path.splitext(output)[0]
+    return [root_file_name + "_%d.pdf" % i for i in [1, 2, 3]]
 
-    if args.debug:
-        root_logger.setLevel(logging.DEBUG)
 
-    if args.silent:
-        consoleHandler.setLevel(logging.ERROR)
-
-    consoleHandler.setFormatter(log_formatter)
-    root_logger.addHandler(consoleHandler)
-
-    print_cmri_welcome("Fig 2C")
+def render(args):
+    '''
+    Draw Fig 2C and save it to args.output.
+    '''
+    import matplotlib.transforms as transforms
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    from table_store import read_table
 
     root_file_name = os.path.splitext(args.output)[0]
-    df_snp=pd.read_csv("../data/df_snp.csv",index_col=0)
-    df_dnp=pd.read_csv("../data/df_dnp.csv",index_col=0)
-    df_indels=pd.read_csv("../data/df_indels.csv",index_col=0)
+    df_snp=read_table("../data/df_snp")
+    df_dnp=read_table("../data/df_dnp")
+    df_indels=read_table("../data/df_indels")
 
     sns.set(font_scale=1)
     sns.set_style("whitegrid")
@@ -85,7 +71,8 @@ if __name__ == "__main__":
 
     plt.subplots_adjust(bottom=0.15, wspace=0.0)
     fig_name=root_file_name+"_1.pdf"
-    plt.savefig(fig_name, format="pdf", bbox_inches='tight',pad_inches=0.25)
+    with Stage("figure save"):
+        plt.savefig(fig_name, format="pdf", bbox_inches='tight',pad_inches=0.25)
     logging.info("Saved figure - %s", fig_name)
 
 
@@ -125,7 +112,8 @@ if __name__ == "__main__":
 
     plt.subplots_adjust(bottom=0.15, wspace=0.0)
     fig_name=root_file_name+"_2.pdf"
-    plt.savefig(fig_name, format="pdf", bbox_inches='tight',pad_inches=0.25)
+    with Stage("figure save"):
+        plt.savefig(fig_name, format="pdf", bbox_inches='tight',pad_inches=0.25)
     logging.info("Saved figure - %s", fig_name)
 
     colors = [
@@ -217,8 +205,10 @@ if __name__ == "__main__":
 
     plt.subplots_adjust(bottom=0.15, wspace=0.0)
     fig_name=root_file_name+"_3.pdf"
-    plt.savefig(fig_name, format="pdf", bbox_inches='tight',pad_inches=0.25)
+    with Stage("figure save"):
+        plt.savefig(fig_name, format="pdf", bbox_inches='tight',pad_inches=0.25)
     logging.info("Saved figure - %s", fig_name)
 
 
-    logging.info("Total computation time: %s", str(pd.to_datetime(time.time(), unit="s") - start_time))
+if __name__ == "__main__":
+    run_figure(FIGURE, OUTPUT, render)
@@ -1,13 +1,11 @@
-import argparse
-import sys
-import time
-import pandas as pd
-from matplotlib.ticker import FuncFormatter
-import matplotlib.transforms as transforms
-import seaborn as sns
-import matplotlib.pyplot as plt
+from figure_runner import draw_error_bars, run_figure, without_error_bars
 from utils import *
 
+FIGURE = "Fig 2D"
+OUTPUT = "../figures/fig2D.pdf"
+# input tables and the columns read from them (None reads all)
+TABLES = {"../data/df_mutation_count_ci": ["motif_type", "category", "region", "mean", "ci_low", "ci_high"]}
+
 
 def scientific(x, pos):
     # x:  tick value - ie. what you currently see in yticks
@@ -15,45 +13,24 @@ def scientific(x, pos):
     return '%.5f' % x
 
 
-if __name__ == "__main__":
-
-    # store start time for benchmarking
-    start_time = pd.to_datetime(time.time(), unit="s")
-
-    # setup logger
-    root_logger, log_formatter = get_cmri_logger()
-
-    # setup arguments
-    parser = argparse.ArgumentParser(description='region indexer for unknown chromosomes', epilog=epilog_text,
-                                     formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
-    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
-    parser.add_argument('-o', '--output', type=str, help='Output file', default="../figures/fig2D.pdf")
-
-    # parse arguments and set logger
-    args = parser.parse_args()
-    consoleHandler = logging.StreamHandler(sys.stdout)
-
-    if args.debug:
-        root_logger.setLevel(logging.DEBUG)
-
-    if args.silent:
-        consoleHandler.setLevel(logging.ERROR)
-
-    consoleHandler.setFormatter(log_formatter)
-    root_logger.addHandler(consoleHandler)
-
-    print_cmri_welcome("Fig 2D")
-
+def render(args):
+    '''
+    Draw Fig 2D and save it to args.output.
+    '''
+    from matplotlib.ticker import FuncFormatter
+    import matplotlib.transforms as transforms
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    from table_store import read_table
 
     scientific_formatter = FuncFormatter(scientific)
 
-    groupby = ["sample_id", "motif_type"]
-    groupby += ["category", "region"]
-
-    df=pd.read_csv("../data/df_mutation_count.csv",index_col=0)
-    df_tmp = df.query("motif_type == 'TTAGGG' and (region == 'telomeric' or region == 'interstitial')").groupby(groupby)[
-        "per_Mbp"].sum().reset_index()
+    # the mean motif count per Mbp of the samples of each category and its bootstrap interval, see
+    # BootstrapIntervals.py
+    df = read_table("../data/df_mutation_count_ci", columns=["motif_type", "category", "region", "mean", "ci_low",
+                                                              "ci_high"])
+    df_tmp = df.query("motif_type == 'TTAGGG' and (region == 'telomeric' or region == 'interstitial')")
+    hue_order = sorted(df_tmp["category"].unique())
 
     sns.set_context("talk")
     sns.set(font_scale=2)
@@ -61,9 +38,10 @@ if __name__ == "__main__":
 
     sns.set_context("talk")
     g = sns.catplot(x="motif_type"
-                    , y="per_Mbp"
+                    , y="mean"
                     , data=df_tmp
                     , hue="category"
+                    , hue_order=hue_order
                     , col="region"
                     , palette=["#717171", "#9f2830"]
                     , kind="bar"
@@ -71,12 +49,18 @@ if __name__ == "__main__":
                     , height=5
                     , aspect=0.5
                     , sharey=False
-                    , capsize=0.15
+                    , **without_error_bars()
                     )
 
     g.set_titles("")
 
+    # the hue bars share the 0.8 width of the motif bar
+    width = 0.8 / len(hue_order)
     for i, ax in enumerate(g.axes.flatten()):
+        df_ci = df_tmp.query("region == '%s'" % ["telomeric", "interstitial"][i]).set_index("category").reindex(
+            hue_order)
+        draw_error_bars(ax, [-0.4 + width * (j + 0.5) for j in range(len(hue_order))], df_ci["ci_low"],
+                        df_ci["ci_high"], capsize=0.15)
         # ax.set_title("Hexmer proportion (interstitial region)")
         if i == 0:
             ax.set_ylabel(" Motif count / Mbp")
@@ -98,7 +82,11 @@ if __name__ == "__main__":
 
     plt.subplots_adjust(bottom=0.15, wspace=0.9)
 
-    plt.savefig(args.output, format="pdf", bbox_inches='tight')
+    with Stage("figure save"):
+        plt.savefig(args.output, format="pdf", bbox_inches='tight')
 
     logging.info("Saved figure - %s", args.output)
-    logging.info("Total computation time: %s", str(pd.to_datetime(time.time(), unit="s") - start_time))
+
+
+if __name__ == "__main__":
+    run_figure(FIGURE, OUTPUT, render)
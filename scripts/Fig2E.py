@@ -1,42 +1,20 @@
-import argparse
-import sys
-import time
-import pandas as pd
-import seaborn as sns
-import matplotlib.pyplot as plt
-import matplotlib.transforms as transforms
-
+from figure_runner import draw_error_bars, run_figure, without_error_bars
 from utils import *
 
-if __name__ == "__main__":
-
-    # store start time for benchmarking
-    start_time = pd.to_datetime(time.time(), unit="s")
-
-    # setup logger
-    root_logger, log_formatter = get_cmri_logger()
-
-    # setup arguments
-    parser = argparse.ArgumentParser(description='region indexer for unknown chromosomes', epilog=epilog_text,
-                                     formatter_class=argparse.RawDescriptionHelpFormatter)
-    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
-    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
-    parser.add_argument('-o', '--output', type=str, help='Output file', default="../figures/fig2E.pdf")
-
-    # parse arguments and set logger
-    args = parser.parse_args()
-    consoleHandler = logging.StreamHandler(sys.stdout)
+FIGURE = "Fig 2E"
+OUTPUT = "../figures/fig2E.pdf"
+# input tables and the columns read from them (None reads all)
+TABLES = {"../data/df_ratio_ci": ["motif_type", "motif_group", "region", "mean", "ci_low", "ci_high"]}
 
-    if args.debug:
-        root_logger.setLevel(logging.DEBUG)
 
-    if args.silent:
-        consoleHandler.setLevel(logging.ERROR)
-
-    consoleHandler.setFormatter(log_formatter)
-    root_logger.addHandler(consoleHandler)
-
-    print_cmri_welcome("Fig 2E")
+def render(args):
+    '''
+    Draw Fig 2E and save it to args.output.
+    '''
+    import seaborn as sns
+    import matplotlib.pyplot as plt
+    import matplotlib.transforms as transforms
+    from table_store import read_table
 
     plt.rc('axes', linewidth=3, labelsize=20)
     plt.rc('xtick', labelsize=20)  # fontsize of the x tick labels
@@ -45,15 +23,19 @@ if __name__ == "__main__":
     sns.set(font_scale=2)
     sns.set_style("white")
 
-    df_sampled=pd.read_csv("../data/df_ratio.csv")
+    # the mean ratio of each motif and its bootstrap interval, see BootstrapIntervals.py
+    df_sampled = read_table("../data/df_ratio_ci", columns=["motif_type", "motif_group", "region", "mean", "ci_low",
+                                                             "ci_high"])
 
     df_tmp = df_sampled.query("region == 'telomeric' and motif_group != 'other' and motif_group != 'regex'")
     ax = sns.barplot(x="motif_type"
-                     , y="value"
+                     , y="mean"
                      , data=df_tmp
-                     , capsize=0.15
+                     , order=df_tmp["motif_type"]
                      , palette=["#9f2830"]
+                     , **without_error_bars()
                      )
+    draw_error_bars(ax, range(len(df_tmp)), df_tmp["ci_low"], df_tmp["ci_high"], capsize=0.15)
 
     ax.set_ylabel("Motif proportion ratio\n(MSH6 KO / Con)")
     ax.set_xlabel("")
@@ -65,7 +47,7 @@ if __name__ == "__main__":
     ax.spines['left'].set_color('0')
     ax.tick_params(direction='out', width=3, bottom=True, left=True)
 
-    TTAGGG_ratio = df_sampled.query("region=='telomeric' and motif_type=='TTAGGG'")["value"].mean()
+    TTAGGG_ratio = df_sampled.query("region=='telomeric' and motif_type=='TTAGGG'")["mean"].mean()
 
     trans = transforms.blended_transform_factory(ax.transAxes, ax.transData)
     ax.text(1, TTAGGG_ratio, "TTAGGG", ha="left", va='bottom', transform=trans, fontsize="x-small")
@@ -74,7 +56,11 @@ if __name__ == "__main__":
     ax.text(1, 1, "Null effect", ha="left", va='center', transform=trans, fontsize="x-small", rotation=-90)
     ax.axhline(1, 0, 1, ls='dotted', c="#000000", lw=3)
 
-    plt.savefig(args.output, format="pdf", bbox_inches='tight')
+    with Stage("figure save"):
+        plt.savefig(args.output, format="pdf", bbox_inches='tight')
 
     logging.info("Saved figure - %s", args.output)
-    logging.info("Total computation time: %s", str(pd.to_datetime(time.time(), unit="s") - start_time))
+
+
+if __name__ == "__main__":
+    run_figure(FIGURE, OUTPUT, render)
@@ -0,0 +1,64 @@
+import argparse
+import sys
+import time
+from functools import partial
+
+from gear_io import read_block_index, write_blocked_array
+from utils import *
+
+
+def index_file(gear_file, block_items=10000, force=False):
+    '''
+    Save a copy of a GEAR output recompressed in blocks, unless it already has an up to date block index.
+    '''
+    if not force and read_block_index(gear_file.path) is not None:
+        logging.info("%s is already indexed", gear_file.path)
+        return 0
+    blocks = write_blocked_array(gear_file.path, block_items)
+    logging.info("%s: %d blocks", gear_file.path, len(blocks))
+    return len(blocks)
+
+
+if __name__ == "__main__":
+
+    # store start time for benchmarking
+    start_time = time.time()
+
+    # setup logger
+    root_logger, log_formatter = get_cmri_logger()
+
+    # setup arguments
+    parser = argparse.ArgumentParser(description='Save copies of the GEAR outputs recompressed in independent gzip '
+                                                 'blocks with a block index, so the blocks of a file can be decoded '
+                                                 'in parallel',
+                                     epilog=epilog_text, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
+    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
+    parser.add_argument('-i', '--input', type=str, help='Input directory', default="../data/GEAR_TELOMERE_MUTATION/")
+    parser.add_argument('-b', '--block_items', type=int, help='Number of reads of each block', default=10000)
+    parser.add_argument('-j', '--jobs', type=int, help='Number of parallel processes (0 uses all the cores)',
+                        default=1)
+    parser.add_argument('--force', action='store_true', help='Recompress the files that are already indexed')
+
+    # parse arguments and set logger
+    args = parser.parse_args()
+    consoleHandler = logging.StreamHandler(sys.stdout)
+
+    if args.debug:
+        root_logger.setLevel(logging.DEBUG)
+
+    if args.silent:
+        consoleHandler.setLevel(logging.ERROR)
+
+    consoleHandler.setFormatter(log_formatter)
+    root_logger.addHandler(consoleHandler)
+
+    print_cmri_welcome("Index GEAR Outputs")
+
+    directory_exists(args.input, True)
+
+    file_list = find_gear_files(args.input)
+    blocks = map_files(partial(index_file, block_items=args.block_items, force=args.force), file_list, args.jobs)
+    logging.info("Indexed %d of %d files", sum(1 for b in blocks if b > 0), len(file_list))
+
+    logging.info("Total computation time: %.1f s", time.time() - start_time)
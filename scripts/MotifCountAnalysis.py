@@ -1,15 +1,32 @@
 import argparse
-import json
+import contextlib
 import sys
 import time
-import gzip
+from functools import partial
 
 import numpy as np
 import pandas as pd
-from Bio.Seq import Seq
 
+from gear_io import *
+from manifest import *
+from motifs import *
+from parse_cache import *
+from table_store import *
 from utils import *
 
+# increase when the parser output changes, it invalidates the cached files
+PARSER_VERSION = 2
+
+# region of each GEAR region name
+REGION_MAP = {'mapq_fail_': "telomeric"
+    , 'qv_fail_': "qv_fail"
+    , 'unmapped_': "telomeric"
+    , 'other_': "other"
+    , 'p_telomere': 'telomeric'
+    , 'q_telomere': 'telomeric'
+    , 'c_interstitial': 'interstitial'
+              }
+
 
 def get_total_read(input_path):
     '''
@@ -25,38 +42,72 @@ def get_total_read(input_path):
     dict
         a dictionary with pairs {sample:count}.
     '''
-    read_map = dict()
-    # iterate all the log files
-    for f in find_files(input_path, "log"):
-        # iterate the log file
-        with open(f) as log_file:
-            # find the Total sequences analysed field
-            for l in log_file:
-                if "Total sequences analysed:" in l:
-                    # the sample id is the GEAR directory name
-                    sample_id = f.split("/")[-2]
-                    read_map[sample_id] = int(l.split(" ")[-1])
-    return read_map
-
-
-def parse_motifs(item, field, chromosome):
-    data_list = list()
-    for motif, values in item[field].items():
-        # temporaty dictionary, we will append the pair {quality value : count} for each qv
-        data_dict = {"chromosome": chromosome, "name": item["name"], "total_reads": item["count"], "motif": motif,
-                     "metric": field}
-        count = 0
-        tmp_dict = dict()
-        # append histogram values
-        for k, v in values.items():
-            tmp_dict[int(k)] = v
-            count += v
-        # create a series (we will use it sort the values and make a cummulative sum) and append total motif count
-        ds = pd.Series(tmp_dict)
-        data_dict.update(ds.sort_index(ascending=False).cumsum().to_dict())
-        data_dict["count"] = count
-        data_list.append(data_dict)
-    return data_list
+    return scan_log_totals(input_path)
+
+
+@Stage("frame building")
+def parse_motifs(data, fields=("motifs", "regex")):
+    '''
+    Decode the motif histograms of a GEAR MotifCount file into a single array.
+
+    Parameters
+    ----------
+    data : dict
+        the decoded GEAR json, a map {chromosome: list of regions}.
+    fields : tuple
+        the region fields with motif histograms.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a data frame with one row per chromosome, region and motif, the reverse cumulative
+        histogram (one column per quality value, in descending order) and the total motif count.
+    '''
+    meta = {"chromosome": list(), "name": list(), "total_reads": list(), "motif": list(), "metric": list()}
+    values_list = list()
+    keys = None
+    # rows whose histogram has other quality value keys than the first one, with their histogram
+    others = list()
+    for chromosome, clist in data.items():
+        for item in clist:
+            for field in fields:
+                for motif, values in item[field].items():
+                    meta["chromosome"].append(chromosome)
+                    meta["name"].append(item["name"])
+                    meta["total_reads"].append(item["count"])
+                    meta["motif"].append(motif)
+                    meta["metric"].append(field)
+                    # histograms usually share the same quality value keys, the others are filled in below
+                    if keys is None:
+                        keys = tuple(values)
+                    if tuple(values) == keys:
+                        values_list.append(list(values.values()))
+                    else:
+                        others.append((len(values_list), values))
+                        values_list.append([0] * len(keys))
+
+    if keys is None:
+        return pd.DataFrame(columns=list(meta) + ["count"])
+
+    # the union of the quality value keys, the bins missing from a histogram are empty
+    column = {k: i for i, k in enumerate(keys)}
+    for _, values in others:
+        for k in values:
+            column.setdefault(k, len(column))
+    histogram = np.zeros((len(values_list), len(column)), dtype=np.int64)
+    histogram[:, :len(keys)] = np.array(values_list, dtype=np.int64).reshape(-1, len(keys))
+    for row, values in others:
+        histogram[row, [column[k] for k in values]] = list(values.values())
+
+    # rows are chromosome x region x motif and columns are quality values in descending order
+    qv = np.array([int(k) for k in column])
+    order = np.argsort(qv)[::-1]
+    histogram = histogram[:, order]
+    cumulative = histogram.cumsum(axis=1)
+
+    df = pd.concat([pd.DataFrame(meta), pd.DataFrame(cumulative, columns=qv[order].tolist())], axis=1)
+    df["count"] = cumulative[:, -1]
+    return df
 
 
 def read_gear_motif_count(input_path):
@@ -74,35 +125,336 @@ def read_gear_motif_count(input_path):
         a data frame with motif count information.
     '''
 
-    # open the input file
-    with gzip.open(input_path) as f:
-        # load the data and create an empty list
-        data = json.load(f)
-        data_list = list()
-        # iterate each chromosome in the file
-        for chromosome, clist in data.items():
-            # iterate each region in the chromosome (for example, telomere are p or q, etc).
-            for item in clist:
-                # total number of reads in this refion
-
-                # motif is a histogram of motif as function of mean base quality of the motif.
-                data_list += parse_motifs(item, "motifs", chromosome)
-                data_list += parse_motifs(item, "regex", chromosome)
-
-                # iterate the map of motifs.
+    # motif is a histogram of motif as function of mean base quality of the motif.
+    df = parse_motifs(read_gear_json(input_path))
     # return only positive count rows.
-    return pd.DataFrame(data_list).query("count != 0")
+    return df.query("count != 0")
+
+
+def threshold_metrics(counts, reads, total_reads, telomere_total, telomeric_total, read_factor):
+    '''
+    Derive the motif metrics from the motif counts above a quality value threshold.
+
+    The arguments can be scalars, one value per row or one value per row and threshold
+    (rows x thresholds), as long as they broadcast with counts.
+
+    Parameters
+    ----------
+    counts : array like
+        the motif counts above the threshold.
+    reads : array like
+        the number of reads of the sample.
+    total_reads : array like
+        the number of reads of the region.
+    telomere_total : array like
+        the TTAGGG count of the sample.
+    telomeric_total : array like
+        the TTAGGG count in the telomeric regions of the sample.
+    read_factor : array like
+        the number of reads of the sample relative to the smallest sample.
+
+    Returns
+    -------
+    dict
+        a map {metric: values}.
+    '''
+    return {"proportion": counts / (reads * 150 / 6)
+        , "raw_proportion": counts / reads
+        , "per_Mbp": 1000000 * counts / (reads * 150)
+        , "relative_proportion": counts / total_reads
+        , "telomere_percentage": counts / telomere_total
+        , "telomere_proportion": counts / telomeric_total
+        , "normalized_count": counts * read_factor
+            }
+
+
+def process_file(gear_file, qv, category_map, sequence_size_map, read_factor_map, region_map, cache=None,
+                 compact=False):
+    '''
+    Read a GEAR MotifCount file and derive the per sample columns.
+
+    Parameters
+    ----------
+    gear_file : GearFile
+        The json file.
+    qv : int
+        the quality value threshold.
+    category_map, sequence_size_map, read_factor_map : dict
+        maps from sample id to category, number of reads and read factor.
+    region_map : dict
+        map from region name to region.
+    cache : CacheConfig
+        the parsed files cache settings, None disables the cache.
+    compact : bool
+        if True return a compact data frame, see compact_motif_count.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a data frame with motif count information of one sample.
+    '''
+    logging.info("Processing file %s", gear_file.path)
+    # read the json files
+    df_tmp = cached_read(cache, read_gear_motif_count, gear_file.path, PARSER_VERSION).query("count != 0")
+    # sample id is assume to be the GEAR directory name
+    sample_id = gear_file.sample_id
+    df_tmp["sample_id"] = sample_id
+    # map each sample id to a category
+    df_tmp["category"] = category_map[sample_id]
+
+    # motif type and group gathered from the motif tables
+    motif_type, motif_group = map_motifs(df_tmp["motif"])
+    df_tmp["motif_type"] = motif_type
+    df_tmp["region"] = df_tmp["name"].map(region_map)
+    df_tmp["reads"] = sequence_size_map[sample_id]
+    df_tmp["motif_group"] = motif_group
+
+    counts = df_tmp[qv]
+    is_telomere = df_tmp["motif_type"] == "TTAGGG"
+    metrics = threshold_metrics(counts, df_tmp["reads"], df_tmp["total_reads"], counts[is_telomere].sum(),
+                                counts[is_telomere & (df_tmp["region"] == "telomeric")].sum(),
+                                read_factor_map[sample_id])
+    for k, v in metrics.items():
+        df_tmp[k] = v
+    df_tmp["read_factor"] = read_factor_map[sample_id]
+    if compact:
+        return compact_motif_count(df_tmp)
+    return df_tmp
+
+
+# repeated text columns of the motif count data frame
+LABEL_COLUMNS = ["chromosome", "name", "motif", "metric", "sample_id", "category", "motif_type", "region",
+                 "motif_group"]
+
+
+def compact_motif_count(df):
+    '''
+    Return the motif count data frame with a compact memory representation.
+
+    The label columns become categorical, the histogram (quality value columns) is stored as a
+    single 2-D block of the smallest unsigned integer type that fits the counts and the other integer
+    columns are downcast. The float metrics are kept as float64, the saved tables are the same as
+    without compaction.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        a motif count data frame.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the compact data frame, with the same columns.
+    '''
+    qv = [c for c in df.columns if isinstance(c, (int, np.integer))]
+    histogram = df[qv].to_numpy()
+    dtype = np.min_scalar_type(histogram.max() if histogram.size > 0 else 0)
+
+    columns = dict()
+    for c in df.columns:
+        if c in qv:
+            continue
+        if c in LABEL_COLUMNS:
+            columns[c] = df[c].astype("category")
+        elif df[c].dtype.kind in "iu":
+            columns[c] = pd.to_numeric(df[c], downcast="unsigned" if (df[c] >= 0).all() else "integer")
+        else:
+            columns[c] = df[c]
+    df_histogram = pd.DataFrame(histogram.astype(dtype), index=df.index, columns=qv)
+    return pd.concat([pd.DataFrame(columns, index=df.index), df_histogram], axis=1)[df.columns]
+
+
+@Stage("concat")
+def concat_motif_counts(data_list):
+    '''
+    Concatenate motif count data frames, keeping the categorical columns categorical.
+
+    The categories are sorted, the groups of the categorical columns come in the same order as
+    the groups of the plain string columns.
+    '''
+    for c in LABEL_COLUMNS:
+        if all(c in df.columns and df[c].dtype.name == "category" for df in data_list):
+            categories = pd.api.types.union_categoricals([df[c] for df in data_list], sort_categories=True).categories
+            for df in data_list:
+                df[c] = df[c].cat.set_categories(categories)
+    return pd.concat(data_list)
+
+
+@Stage("ratio")
+def calculate_ratio(df_control_treatment, control="Con", treatment="MSH6 KO"):
+    '''
+    Compute every pairwise treatment / control ratio of each row.
+
+    Parameters
+    ----------
+    df_control_treatment : pandas.DataFrame
+        a pivot table with one row per motif and columns (category, sample_id).
+    control : str
+        the control category.
+    treatment : str
+        the treatment category.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a long format data frame with the row index levels, the pair number as category
+        (control i and treatment j give i * number of treatments + j) and the ratio as value.
+    '''
+    # zero control values give NaN ratios
+    control_values = df_control_treatment[control].replace(0, np.nan).values
+    treatment_values = df_control_treatment[treatment].values
+    rows, n = control_values.shape
+    m = treatment_values.shape[1]
+    # ratio[row, i, j] = treatment[row, j] / control[row, i]
+    ratio = treatment_values[:, np.newaxis, :] / control_values[:, :, np.newaxis]
+
+    df_ratio = pd.DataFrame({c: np.tile(df_control_treatment.index.get_level_values(c), n * m)
+                             for c in df_control_treatment.index.names})
+    df_ratio["category"] = np.repeat(np.arange(n * m), rows)
+    df_ratio["value"] = ratio.reshape(rows, n * m).T.flatten()
+    return df_ratio
+
+
+def parse_thresholds(text):
+    '''
+    Parse a list of thresholds, either comma separated values or a range start:stop[:step] (stop included).
+    '''
+    if ":" in text:
+        bounds = [int(x) for x in text.split(":")]
+        step = bounds[2] if len(bounds) > 2 else 1
+        return list(range(bounds[0], bounds[1] + 1, step))
+    return [int(x) for x in text.split(",")]
+
+
+@Stage("threshold sweep")
+def sweep_thresholds(df, thresholds):
+    '''
+    Derive the motif metrics for several quality value thresholds in a single pass.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        the motif count data frame, with the cumulative histogram and the per sample columns.
+    thresholds : list
+        the quality value thresholds.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a long format data frame with one row per motif and threshold.
+    '''
+    counts = df[thresholds].values.astype(np.int64)
+    sample_id = df["sample_id"].values
+    is_telomere = (df["motif_type"] == "TTAGGG").values
+    is_telomeric = is_telomere & (df["region"] == "telomeric").values
+    # TTAGGG totals of each sample and threshold, broadcast back to the rows
+    telomere_total = pd.DataFrame(counts * is_telomere[:, np.newaxis]).groupby(sample_id).transform("sum").values
+    telomeric_total = pd.DataFrame(counts * is_telomeric[:, np.newaxis]).groupby(sample_id).transform("sum").values
+
+    # float64 like the per sample columns, the downcast integer columns of a compact data frame
+    # would overflow in the products
+    reads, total_reads, read_factor = [df[[c]].values.astype(np.float64) for c in ("reads", "total_reads",
+                                                                                   "read_factor")]
+    metrics = threshold_metrics(counts, reads, total_reads, telomere_total, telomeric_total, read_factor)
+
+    id_columns = ["chromosome", "name", "total_reads", "motif", "metric", "count", "sample_id", "category",
+                  "motif_type", "region", "reads", "motif_group", "read_factor"]
+    df_sweep = pd.DataFrame({c: np.repeat(df[c].values, len(thresholds)) for c in id_columns})
+    df_sweep["threshold"] = np.tile(thresholds, len(df))
+    df_sweep["threshold_count"] = counts.flatten()
+    for k, v in metrics.items():
+        df_sweep[k] = v.flatten()
+    return df_sweep
+
+
+@Stage("group-by")
+def raw_proportion_sums(df, index=("motif_type", "motif_group", "region")):
+    '''
+    Return the raw proportion summed by index, sample and category.
+    '''
+    return df.groupby(list(index) + ["sample_id", "category"], observed=True)["raw_proportion"].sum()
 
 
-def calculate_ratio(ds):
-    control=ds["Con"].replace(0,np.nan).values
-    n=control.shape[0]
-    treatment=ds["MSH6 KO"].values
-    m=treatment.shape[0]
-    ratio=(treatment*np.ones((m,n))/(control*np.ones((n,m))).T).flatten()
-    for i,r in enumerate(ratio):
-        ds.loc[i]=r
-    return ds
+@Stage("pivot")
+def pivot_control_treatment(sums, index=("motif_type", "motif_group", "region")):
+    '''
+    Return the summed raw proportion as a pivot table with columns (category, sample_id).
+    '''
+    return pd.pivot_table(sums.reset_index(), index=list(index), columns=['category', "sample_id"],
+                          values="raw_proportion", observed=True)
+
+
+def control_treatment_table(df, index=("motif_type", "motif_group", "region")):
+    '''
+    Return the raw proportion of each motif as a pivot table with columns (category, sample_id).
+    '''
+    return pivot_control_treatment(raw_proportion_sums(df, index), index)
+
+
+def add_partial_sums(total, partial):
+    '''
+    Fold the partial sums of a file into the running sums (None before the first file).
+    '''
+    if total is None:
+        return partial
+    return total.add(partial, fill_value=0)
+
+
+def aggregate_out_of_core(results, qv, output_path, table_format, thresholds=None):
+    '''
+    Aggregate the motif counts file by file, without building the concatenated data frame.
+
+    Each file is appended to the motif count table (and the sweep table) and folded into
+    running sums of the TTAGGG counts and of the raw proportion, the only aggregates needed
+    by the ratios. Every file holds a single sample, so the per sample metrics of the sweep
+    are computed file by file.
+
+    Parameters
+    ----------
+    results : iterable
+        the motif count data frame of each file.
+    qv : int
+        the quality value threshold.
+    output_path : str
+        the output directory.
+    table_format : str
+        the output tables format.
+    thresholds : list
+        the quality value thresholds of the sweep, None disables the sweep.
+
+    Returns
+    -------
+    tuple
+        the TTAGGG totals by sample (pandas.Series), the summed raw proportion by index, sample and
+        category, and the same sums by threshold (None without a sweep).
+    '''
+    telomere_total, sums, sums_sweep = None, None, None
+    # both writers are closed (and the columnar files get their footer) even if a file fails
+    with contextlib.ExitStack() as stack:
+        writer = stack.enter_context(TableWriter(os.path.join(output_path, "df_mutation_count"), table_format))
+        sweep_writer = None
+        if thresholds is not None:
+            sweep_writer = stack.enter_context(TableWriter(os.path.join(output_path, "df_mutation_count_sweep"),
+                                                           table_format))
+        for df in results:
+            writer.write(df)
+            telomere_total = add_partial_sums(telomere_total, df.query("motif_type == 'TTAGGG'").groupby(
+                "sample_id", observed=True)[qv].sum())
+            sums = add_partial_sums(sums, raw_proportion_sums(df))
+            if sweep_writer is not None:
+                df_sweep = sweep_thresholds(df, thresholds)
+                # continue the row numbers of the previous files
+                df_sweep.index += sweep_writer.rows
+                sweep_writer.write(df_sweep)
+                sums_sweep = add_partial_sums(sums_sweep, raw_proportion_sums(
+                    df_sweep, ("threshold", "motif_type", "motif_group", "region")))
+    if telomere_total is None:
+        raise ValueError("No motif count data to aggregate")
+    logging.info("File Saved: %s (%d rows)", writer.output_file, writer.rows)
+    if sweep_writer is not None:
+        logging.info("File Saved: %s (%d rows)", sweep_writer.output_file, sweep_writer.rows)
+    return telomere_total.rename("TTAGGG_total"), sums, sums_sweep
+
 
 if __name__ == "__main__":
 
@@ -122,6 +474,20 @@ if __name__ == "__main__":
     parser.add_argument('-q', '--quality_value_threshold', type=int, help='Set the quality value threshold for the '
                                                                           'motif filtering',
                         default=35)
+    parser.add_argument('--sweep', type=str, help='Quality value thresholds to sweep, comma separated (e.g. 20,30) '
+                                                  'or a range start:stop[:step], stop included (e.g. 20:40:5)',
+                        default=None)
+    parser.add_argument('--compact', action='store_true', help='Keep the motif count table in memory with '
+                                                               'categorical labels and unsigned histogram counts')
+    parser.add_argument('--out_of_core', action='store_true', help='Aggregate the files one at a time, without '
+                                                                   'loading the whole motif count table in memory')
+    parser.add_argument('-j', '--jobs', type=int, help='Number of parallel processes (0 uses all the cores)',
+                        default=1)
+    add_cache_arguments(parser)
+    add_format_argument(parser)
+    add_manifest_argument(parser)
+    add_trace_argument(parser)
+    add_json_argument(parser)
 
     # parse arguments and set logger
     args = parser.parse_args()
@@ -137,125 +503,68 @@ if __name__ == "__main__":
     root_logger.addHandler(consoleHandler)
 
     print_cmri_welcome("Motif Count Analysis")
+    set_json_decoder(args.json_decoder)
 
     qv = args.quality_value_threshold
 
-    region_map = {'mapq_fail_': "telomeric"
-        , 'qv_fail_': "qv_fail"
-        , 'unmapped_': "telomeric"
-        , 'other_': "other"
-        , 'p_telomere': 'telomeric'
-        , 'q_telomere': 'telomeric'
-        , 'c_interstitial': 'interstitial'
-                  }
-    category_map = {"A1L1": "Con"
-        , "A1L2": "Con"
-        , "A2L1": "Con"
-        , "A2L2": "Con"
-        , "A3L1": "MSH6 KO"
-        , "A3L2": "MSH6 KO"
-        , "A4L1": "MSH6 KO"
-        , "A4L2": "MSH6 KO"
-                    }
-    sequence_size_map = {
-        "A1L1": 178424347
-        , "A1L2": 173957699
-        , "A2L1": 171704752
-        , "A2L2": 163338462
-        , "A3L1": 171391614
-        , "A3L2": 158500729
-        , "A4L1": 192706327
-        , "A4L2": 179876862
-    }
-
-    motif_type = np.sort(
-        ['CTAGGG', 'ATAGGG', 'CTAGGG', 'TTAGGC', 'GTAGGG', 'TAAGGG', 'TCAGGG', 'TTAGGA', 'TGAGGG', 'TTAAGG', 'TTACGG',
-         'TTAGAG', 'TTAGCG', 'TTAGGA', 'TTAGGC', 'TTAGGG', 'TTAGGT', 'TTAGTG', 'TTATGG', 'TTCGGG', 'TTGGGG', 'TTTGGG'])
-
-    strand_map = dict()
-    for m in motif_type:
-        strand_map[m] = m
-        strand_map[str(Seq(m).reverse_complement())] = m
-
-    regex_list = ["TTAGGG(G{%d})[AC]" % (x + 1) for x in np.arange(5)]
-    regex_list += ["TTAGGG(G{6,})[AC]"]
-    regex_list += ["TTAGGG(G{%d})TAGGG" % (x + 1) for x in np.arange(5)]
-    regex_list += ["TTAGGG(G{6,})TAGGG"]
-
-    for m in regex_list:
-        strand_map[m] = m
-
-    strand_map.update({"[TG](C{%d})CCCTAA" % (x + 1): "TTAGGG(G{%d})[AC]" % (x + 1) for x in np.arange(5)})
-    strand_map.update({"[TG](C{6,})CCCTAA": "TTAGGG(G{6,})[AC]"})
-    strand_map.update({"CCCTA(C{%d})CCCTAA" % (x + 1): "TTAGGG(G{%d})TAGGG" % (x + 1) for x in np.arange(5)})
-    strand_map.update({"CCCTA(C{6,})CCCTAA": "TTAGGG(G{6,})TAGGG"})
+    manifest = load_manifest(args.manifest, args.input,
+                             None if args.cache_dir is None else os.path.join(args.cache_dir, "log_totals.json"))
+    category_map = manifest["category"].to_dict()
+    sequence_size_map = manifest["reads"].to_dict()
+
     # get the read size of each sample.
     read_factor_map = {k: v / np.min(list(sequence_size_map.values())) for k, v in sequence_size_map.items()}
 
-    motif_group_map = dict()
-    for k, v in strand_map.items():
-        if "(" in v:
-            motif_group_map[k] = "regex"
-        elif v in ["TTAGGG", "TCAGGG", "TGAGGG", "TTGGGG"]:
-            motif_group_map[k] = "canonical"
-        elif v[-3:] == 'GGG':
-            motif_group_map[k] = "Gs"
-        else:
-            motif_group_map[k] = "other"
-
-    # Iterate all the files in path
-    data_list = list()
-    for f in find_files(args.input, "json.gz",compressed=True):
-        if os.path.basename(f)[0] == ".":
-            continue
-        logging.info("Processing file %s", f)
-        # read the json files
-        df_tmp = read_gear_motif_count(f).query("count != 0")
-        # sample id is assume to be the GEAR directory name
-        sample_id = f.split("/")[-3]+f.split("/")[-2]
-        df_tmp["sample_id"] = sample_id
-        # map each sample id to a category
-        df_tmp["category"] = category_map[sample_id]
-
-        df_tmp["motif_type"] = df_tmp["motif"].map(strand_map)
-        df_tmp["region"] = df_tmp["name"].map(region_map)
-        df_tmp["reads"] = sequence_size_map[sample_id]
-        df_tmp["motif_group"] = df_tmp["motif"].map(motif_group_map)
-        df_tmp["proportion"] = df_tmp[qv] / (df_tmp["reads"] * 150 / 6)
-        df_tmp["raw_proportion"] = df_tmp[qv] / df_tmp["reads"]
-        df_tmp["per_Mbp"] = 1000000 * df_tmp[qv] / (df_tmp["reads"] * 150)
-        df_tmp["relative_proportion"] = df_tmp[qv] / df_tmp["total_reads"]
-        df_tmp["telomere_percentage"] = df_tmp[qv] / (df_tmp.query("motif_type == 'TTAGGG'")[qv].sum())
-        df_tmp["telomere_proportion"] = df_tmp[qv] / (
-            df_tmp.query("motif_type == 'TTAGGG' and region=='telomeric'")[qv].sum())
-        df_tmp["normalized_count"] = df_tmp[qv] * read_factor_map[sample_id]
-        df_tmp["read_factor"] = read_factor_map[sample_id]
-        data_list.append(df_tmp)
-
-    df = pd.concat(data_list)
-
-
-    output_file="../data/df_mutation_count.csv"
-    df.to_csv(output_file)
+    logging.debug("Motif tables version %d, %d motifs", MOTIF_TABLE_VERSION, len(MOTIF_TABLE.index))
+
+    # Iterate all the files in path, in a deterministic order
+    file_list = find_gear_files(args.input)
+    if len(file_list) == 0:
+        logging.error("No GEAR MotifCount files found in %s", args.input)
+        exit(errno.ENOENT)
+    results = imap_files(partial(process_file, qv=qv, category_map=category_map,
+                                 sequence_size_map=sequence_size_map, read_factor_map=read_factor_map,
+                                 region_map=REGION_MAP,
+                                 cache=cache_config_from_args(args), compact=args.compact),
+                         file_list, args.jobs)
+    thresholds = None if args.sweep is None else parse_thresholds(args.sweep)
+    if thresholds is not None:
+        logging.info("Sweeping quality value thresholds: %s", thresholds)
+
+    if args.out_of_core:
+        # fold each file into the aggregates, the full table is only written to disk
+        df_total, sums, sums_sweep = aggregate_out_of_core(results, qv, args.output, args.format, thresholds)
+        logging.debug("TTAGGG totals:\n%s", df_total.to_string())
+        df_control_treatment = pivot_control_treatment(sums)
+    else:
+        df = concat_motif_counts(list(results))
+        logging.info("Motif count table: %d rows, %.1f MB", len(df), df.memory_usage(deep=True).sum() / 1e6)
+
+        output_file = write_table(df, os.path.join(args.output, "df_mutation_count"), args.format)
+        logging.info("File Saved: %s", output_file)
+
+        with Stage("group-by"):
+            df_total = df.query("motif_type == 'TTAGGG'").groupby("sample_id", observed=True)[qv].sum()
+        df = pd.merge(df, df_total.reset_index().rename(columns={qv: "TTAGGG_total"}), on="sample_id", how="left")
+        df_control_treatment = control_treatment_table(df)
+
+    df_ratio = calculate_ratio(df_control_treatment)
+    output_file = write_table(df_ratio, os.path.join(args.output, "df_ratio"), args.format)
     logging.info("File Saved: %s", output_file)
 
-    df = pd.merge(df, df.query("motif_type == 'TTAGGG'").groupby("sample_id")[qv].sum().reset_index().rename(
-        columns={qv: "TTAGGG_total"}), on="sample_id", how="left")
-
-    df_control_treatment = df.groupby(["region", "sample_id", "category", "motif_type", "motif_group"])[
-        "raw_proportion"].sum().reset_index()
-    df_control_treatment = pd.pivot_table(df_control_treatment, index=["motif_type", "motif_group", "region"],
-                                          columns=['category', "sample_id"], values="raw_proportion").reset_index()
-
-    df_ratio = df_control_treatment.apply(calculate_ratio, axis=1)
-
-    del df_ratio["Con"]
-    del df_ratio["MSH6 KO"]
-
-    df_ratio.columns = df_ratio.columns.droplevel(1)
+    if thresholds is not None:
+        sweep_index = ("threshold", "motif_type", "motif_group", "region")
+        if args.out_of_core:
+            df_control_treatment_sweep = pivot_control_treatment(sums_sweep, sweep_index)
+        else:
+            df_sweep = sweep_thresholds(df, thresholds)
+            output_file = write_table(df_sweep, os.path.join(args.output, "df_mutation_count_sweep"), args.format)
+            logging.info("File Saved: %s", output_file)
+            df_control_treatment_sweep = control_treatment_table(df_sweep, sweep_index)
 
-    output_file="../data/df_ratio.csv"
-    pd.melt(df_ratio, value_vars=np.arange(15), id_vars=["motif_type", "motif_group", "region"]).to_csv(output_file)
-    logging.info("File Saved: %s", output_file)
+        df_ratio_sweep = calculate_ratio(df_control_treatment_sweep)
+        output_file = write_table(df_ratio_sweep, os.path.join(args.output, "df_ratio_sweep"), args.format)
+        logging.info("File Saved: %s", output_file)
 
+    report_stages(args.trace)
     logging.info("Total computation time: %s", str(pd.to_datetime(time.time(), unit="s") - start_time))
@@ -0,0 +1,265 @@
+import argparse
+import fnmatch
+import hashlib
+import importlib
+import subprocess
+import sys
+import time
+from collections import namedtuple
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from table_store import add_format_argument, set_table_format, table_file, table_files
+from utils import *
+
+# A pipeline step: a script run with its arguments, the files or directories it reads and the files it writes.
+# The tables are given without extension, the steps that write them are found from the outputs. Only the
+# files of the input directories matching the patterns are read by the step, the other files are ignored.
+Node = namedtuple("Node", ["name", "script", "args", "inputs", "outputs", "patterns"], defaults=[("*.json.gz",)])
+
+# files read from the GEAR output directories: the outputs, and the logs when the manifest has no reads
+GEAR_OUTPUTS = ("*.json.gz",)
+GEAR_OUTPUTS_AND_LOGS = ("*.json.gz", "*.log")
+
+# fingerprints of the last run of each step
+STATE_FILE = "../data/.pipeline_state.json"
+
+FIGURE_MODULES = ["Fig2A", "Fig2B", "Fig2C", "Fig2D", "Fig2E"]
+
+
+def analysis_nodes(args):
+    '''
+    Return the steps that derive the intermediate tables from the GEAR outputs.
+    '''
+    return [Node("motif_count", "MotifCountAnalysis.py",
+                 ["-q", str(args.quality_value_threshold), "-f", args.format],
+                 ["../data/GEAR_MOTIF_COUNT/", "../data/manifest.tsv"],
+                 ["../data/df_mutation_count", "../data/df_ratio"], GEAR_OUTPUTS_AND_LOGS),
+            Node("variant_call", "VariantCallAnalysis.py", ["-f", args.format],
+                 ["../data/GEAR_VCA/"],
+                 ["../data/df_snp", "../data/df_dnp", "../data/df_indels"], GEAR_OUTPUTS),
+            Node("telomere", "TelomereLengthAndMutationsAnalysis.py", ["-f", args.format],
+                 ["../data/GEAR_TELOMERE_MUTATION/", "../data/manifest.tsv"],
+                 ["../data/df_telomere_content"], GEAR_OUTPUTS_AND_LOGS),
+            Node("intervals", "BootstrapIntervals.py", ["-f", args.format],
+                 ["../data/df_ratio", "../data/df_mutation_count", "../data/df_signature_contribution"],
+                 ["../data/df_ratio_ci", "../data/df_mutation_count_ci", "../data/df_signature_contribution_ci"])]
+
+
+def figure_nodes(args):
+    '''
+    Return the steps that draw the figures, from the inputs and outputs declared by the figure scripts.
+    '''
+    nodes = list()
+    for name in FIGURE_MODULES:
+        module = importlib.import_module(name)
+        outputs = module.output_files(module.OUTPUT) if hasattr(module, "output_files") else [module.OUTPUT]
+        nodes.append(Node(name, name + ".py", ["-f", args.format], sorted(module.TABLES), outputs))
+    return nodes
+
+
+def path_signature(path, patterns=GEAR_OUTPUTS):
+    '''
+    Return the identity (path, size and modification time) of a file, a table or every file of a directory
+    whose name matches one of the glob patterns.
+    '''
+    if os.path.isdir(path):
+        files = scan_files(path, lambda name: any(fnmatch.fnmatchcase(name, p) for p in patterns))
+        return [path_signature(e.path) for e in files]
+    if not os.path.exists(path):
+        # a table, the file read by find_table
+        candidates = table_files(path)
+        if len(candidates) == 0:
+            return [path, None]
+        path = candidates[0]
+    stat = os.stat(path)
+    return [path, stat.st_size, stat.st_mtime_ns]
+
+
+def digest(value):
+    return hashlib.sha1(json.dumps(value, sort_keys=True).encode()).hexdigest()
+
+
+def node_fingerprint(node):
+    '''
+    Return the fingerprints of the code, parameters and inputs of a step.
+    '''
+    code = dict()
+    for code_file in sorted(local_modules(node.script)):
+        with open(code_file, "rb") as f:
+            code[code_file] = hashlib.sha1(f.read()).hexdigest()
+    return {"code": digest(code), "params": digest(node.args), "inputs": digest([path_signature(p, node.patterns)
+                                                                                 for p in node.inputs])}
+
+
+def outputs_exist(node, table_format):
+    for output in node.outputs:
+        if not (os.path.exists(output) or os.path.exists(table_file(output, table_format))):
+            return False
+    return True
+
+
+def stale_reason(node, fingerprint, state, table_format, rebuilt):
+    '''
+    Return why a step must run, None if it is up to date.
+    '''
+    upstream = [i for i in node.inputs if i in rebuilt]
+    if len(upstream) > 0:
+        return "input rebuilt (%s)" % ", ".join(os.path.basename(u) for u in upstream)
+    previous = state.get(node.name)
+    if previous is None:
+        return "never run"
+    changed = [k for k in ["code", "params", "inputs"] if previous.get(k) != fingerprint[k]]
+    if len(changed) > 0:
+        return "%s changed" % ", ".join(changed)
+    if not outputs_exist(node, table_format):
+        return "missing outputs"
+    return None
+
+
+def run_node(node, silent=False):
+    '''
+    Run a step in a new process, return its exit code.
+    '''
+    command = [sys.executable, node.script] + node.args + (["-s"] if silent else [])
+    logging.info("Running %s: %s", node.name, " ".join(command[1:]))
+    start = time.time()
+    code = subprocess.call(command)
+    logging.info("%s finished in %.1f s (exit code %d)", node.name, time.time() - start, code)
+    return code
+
+
+def save_state(state):
+    with open(STATE_FILE, "w") as f:
+        json.dump(state, f, indent=1, sort_keys=True)
+
+
+def run_pipeline(nodes, state, table_format, jobs=1, force=False, dry_run=False, silent=False):
+    '''
+    Run the stale steps, the steps whose dependencies are done run in parallel.
+
+    A step is stale if its code, parameters or inputs changed since its last run, if its
+    outputs are missing or if a step it depends on runs. The fingerprint of a step is computed
+    once its dependencies are done, so it sees their new outputs.
+
+    Parameters
+    ----------
+    nodes : list
+        the pipeline steps.
+    state : dict
+        the fingerprints of the last run of each step, updated with the steps run.
+    table_format : str
+        the format of the tables written by the steps.
+    jobs : int
+        number of steps run at a time.
+    force : bool
+        if True every step runs.
+    dry_run : bool
+        if True report the steps that would run without running them.
+    silent : bool
+        run the steps in silent mode.
+
+    Returns
+    -------
+    int
+        0 if every step run succeeded, otherwise the exit code of the first failed step.
+    '''
+    producers = {output: node.name for node in nodes for output in node.outputs}
+    dependencies = {node.name: {producers[i] for i in node.inputs if i in producers} for node in nodes}
+    done, failed, rebuilt = set(), set(), set()
+    exit_code = 0
+    running = dict()
+
+    with ThreadPoolExecutor(max_workers=max(jobs, 1)) as executor:
+        pending = list(nodes)
+        while pending or running:
+            for node in list(pending):
+                if dependencies[node.name] & failed:
+                    logging.error("Skipping %s, a step it depends on failed", node.name)
+                    failed.add(node.name)
+                    pending.remove(node)
+                    continue
+                if not dependencies[node.name] <= done:
+                    continue
+                pending.remove(node)
+                fingerprint = node_fingerprint(node)
+                reason = "forced" if force else stale_reason(node, fingerprint, state, table_format, rebuilt)
+                if reason is None:
+                    logging.info("%-14s up to date", node.name)
+                    done.add(node.name)
+                elif dry_run:
+                    logging.info("%-14s would run: %s", node.name, reason)
+                    rebuilt.update(node.outputs)
+                    done.add(node.name)
+                else:
+                    logging.info("%-14s stale: %s", node.name, reason)
+                    running[executor.submit(run_node, node, silent)] = (node, fingerprint)
+
+            if not running:
+                continue
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                node, fingerprint = running.pop(future)
+                code = future.result()
+                if code == 0:
+                    # the inputs are fingerprinted before the run, a change during the run is seen next time
+                    state[node.name] = fingerprint
+                    save_state(state)
+                    rebuilt.update(node.outputs)
+                    done.add(node.name)
+                else:
+                    logging.error("%s failed with exit code %d", node.name, code)
+                    failed.add(node.name)
+                    exit_code = exit_code or code
+    return exit_code
+
+
+if __name__ == "__main__":
+
+    # store start time for benchmarking
+    start_time = time.time()
+
+    # setup logger
+    root_logger, log_formatter = get_cmri_logger()
+
+    # setup arguments
+    parser = argparse.ArgumentParser(description='Run the analysis and figure scripts that are out of date',
+                                     epilog=epilog_text, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
+    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
+    parser.add_argument('-q', '--quality_value_threshold', type=int, help='Set the quality value threshold for the '
+                                                                          'motif count analysis', default=35)
+    parser.add_argument('-j', '--jobs', type=int, help='Number of steps run in parallel (0 uses all the cores)',
+                        default=0)
+    parser.add_argument('-n', '--dry_run', action='store_true', help='Show the steps that would run')
+    parser.add_argument('--force', action='store_true', help='Run every step')
+    add_format_argument(parser)
+
+    # parse arguments and set logger
+    args = parser.parse_args()
+    consoleHandler = logging.StreamHandler(sys.stdout)
+
+    if args.debug:
+        root_logger.setLevel(logging.DEBUG)
+
+    if args.silent:
+        consoleHandler.setLevel(logging.ERROR)
+
+    consoleHandler.setFormatter(log_formatter)
+    root_logger.addHandler(consoleHandler)
+
+    print_cmri_welcome("Pipeline")
+
+    # the inputs are fingerprinted in the format the steps read
+    set_table_format(args.format)
+
+    state = dict()
+    if file_exists(STATE_FILE):
+        with open(STATE_FILE) as f:
+            state = json.load(f)
+
+    nodes = analysis_nodes(args) + figure_nodes(args)
+    exit_code = run_pipeline(nodes, state, args.format, args.jobs or os.cpu_count(), args.force, args.dry_run,
+                             args.silent)
+
+    logging.info("Total computation time: %.1f s", time.time() - start_time)
+    sys.exit(exit_code)
@@ -0,0 +1,152 @@
+import argparse
+import hashlib
+import importlib
+import time
+from functools import partial
+
+from figure_runner import add_input_format_argument, import_plotting, report_startup, run_figure, \
+    set_console_logger
+from table_store import find_table, load_tables, set_table_format
+from utils import *
+
+# figure scripts rendered, each one defines FIGURE, OUTPUT, TABLES and render
+FIGURE_MODULES = ["Fig2A", "Fig2B", "Fig2C", "Fig2D", "Fig2E"]
+
+# fingerprints of the last rendered figures, saved in the output directory
+STATE_FILE = ".render_state.json"
+
+
+def figure_outputs(module, output):
+    '''
+    Return the files saved by a figure module.
+    '''
+    if hasattr(module, "output_files"):
+        return module.output_files(output)
+    return [output]
+
+
+def figure_fingerprint(module):
+    '''
+    Return a digest of the code of a figure and of its input tables.
+
+    The code is the figure script and the modules of this directory it imports, recursively
+    (see utils.local_modules), the tables are identified by their file, size and modification time.
+    '''
+    digest = hashlib.sha1()
+    for code_file in sorted(local_modules(module.__file__)):
+        with open(code_file, "rb") as f:
+            digest.update(f.read())
+    for path, columns in sorted(module.TABLES.items()):
+        input_file = find_table(path)
+        stat = os.stat(input_file)
+        digest.update(("%s:%d:%d:%s" % (input_file, stat.st_size, stat.st_mtime_ns, columns)).encode())
+    return digest.hexdigest()
+
+
+def merge_tables(modules):
+    '''
+    Return the tables read by the figure modules, with the union of the columns each figure reads.
+    '''
+    tables = dict()
+    for module in modules:
+        for path, columns in module.TABLES.items():
+            if path in tables and (tables[path] is None or columns is None):
+                tables[path] = None
+            elif path in tables:
+                tables[path] = tables[path] + [c for c in columns if c not in tables[path]]
+            else:
+                tables[path] = None if columns is None else list(columns)
+    return tables
+
+
+def render_figure(figure, table_format="csv", silent=False, debug=False):
+    '''
+    Render one figure, figure is a pair (module name, output file).
+    '''
+    name, output = figure
+    module = importlib.import_module(name)
+    argv = ["-o", output, "-f", table_format] + (["-s"] if silent else []) + (["-d"] if debug else [])
+    # the stages are reported once by the main process
+    run_figure(module.FIGURE, module.OUTPUT, module.render, argv, report=False)
+    return name
+
+
+def load_shared(tables):
+    '''
+    Import the plotting modules and load the tables read by the figures, see imap_files.
+    '''
+    import_plotting()
+    load_tables(tables)
+
+
+def load_state(state_file):
+    if file_exists(state_file):
+        with open(state_file) as f:
+            return json.load(f)
+    return dict()
+
+
+if __name__ == "__main__":
+
+    # store start time for benchmarking
+    start_time = time.time()
+
+    # setup arguments
+    parser = argparse.ArgumentParser(description='Render all the figures', epilog=epilog_text,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
+    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
+    parser.add_argument('-o', '--output', type=str, help='Output directory', default="../figures/")
+    parser.add_argument('-j', '--jobs', type=int, help='Number of parallel processes (0 uses all the cores)',
+                        default=0)
+    add_input_format_argument(parser)
+    parser.add_argument('--force', action='store_true', help='Render the figures even if their code and input '
+                                                             'tables are unchanged')
+    parser.add_argument('--profile-startup', action='store_true', help='Report the import time of the plotting '
+                                                                       'modules')
+    add_trace_argument(parser)
+
+    # parse arguments and set logger
+    args = parser.parse_args()
+    set_console_logger(args)
+
+    print_cmri_welcome("Render All")
+
+    set_table_format(args.format)
+
+    os.makedirs(args.output, exist_ok=True)
+    state_file = os.path.join(args.output, STATE_FILE)
+    state = load_state(state_file)
+
+    # find the figures whose code or input tables changed since the last render
+    pending = list()
+    fingerprints = dict()
+    for name in FIGURE_MODULES:
+        module = importlib.import_module(name)
+        output = os.path.join(args.output, os.path.basename(module.OUTPUT))
+        fingerprints[name] = figure_fingerprint(module)
+        if not args.force and state.get(name) == fingerprints[name] and all(
+                file_exists(f) for f in figure_outputs(module, output)):
+            logging.info("%s is up to date", module.FIGURE)
+        else:
+            pending.append((module, output))
+
+    if len(pending) > 0:
+        startup = time.time() - start_time
+        if args.profile_startup:
+            report_startup(import_plotting(), startup)
+
+        try:
+            # the plotting modules and the tables are loaded once, before the worker processes are forked
+            for name in imap_files(partial(render_figure, table_format=args.format, silent=args.silent,
+                                           debug=args.debug),
+                                   [(module.__name__, output) for module, output in pending], args.jobs,
+                                   setup=load_shared, setup_args=(merge_tables([module for module, _ in pending]),)):
+                state[name] = fingerprints[name]
+        finally:
+            with open(state_file, "w") as f:
+                json.dump(state, f, indent=1)
+
+    report_stages(args.trace)
+    logging.info("Rendered %d of %d figures", len(pending), len(FIGURE_MODULES))
+    logging.info("Total computation time: %.1f s", time.time() - start_time)
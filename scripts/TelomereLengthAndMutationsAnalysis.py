@@ -1,15 +1,229 @@
 import argparse
-import json
+import hashlib
 import sys
 import time
-import gzip
+from array import array
+from collections import namedtuple
+from functools import partial
 import numpy as np
 import pandas as pd
 
+from cs_string import *
+from gear_io import *
+from manifest import *
+from parse_cache import *
+from read_buffer import *
+from table_store import *
 from utils import *
 
+# increase when the parser output changes, it invalidates the cached files
+PARSER_VERSION = 2
+SUMMARY_VERSION = 2
+PROFILE_VERSION = 2
 
-def read_gear_mutations(input_path):
+# read fields summed by the telomere summary, besides the variant repeat counts
+SUMMARY_FIELDS = ["mlen", "seq_len"]
+
+REPEAT_BASES = set("ACGT")
+
+# aligned bases of each cs string operation, summed by the telomere summary
+CS_FIELDS = ["cs_" + name for name in OP_NAMES]
+
+# read strings decoded in batches (see read_buffer) instead of being stored for each event
+READ_STRING_FIELDS = ["seq", "qv", "seq_trimmed", "qv_trimmed"]
+
+
+def _store_value(columns, int_columns, key, row, value, size):
+    '''
+    Store a value in a preallocated column buffer, creating the buffer when the key is new.
+
+    Numeric values are stored as float (NaN marks missing values) and the columns where
+    every value is an integer are tracked so the chunk can be restored to int64.
+    '''
+    column = columns.get(key)
+    is_number = isinstance(value, (int, float)) and not isinstance(value, bool)
+    if column is None:
+        if is_number:
+            column = np.full(size, np.nan)
+            if isinstance(value, int):
+                int_columns.add(key)
+        else:
+            column = np.full(size, np.nan, dtype=object)
+        columns[key] = column
+    elif column.dtype != object and not is_number:
+        column = column.astype(object)
+        columns[key] = column
+        int_columns.discard(key)
+    if key in int_columns and not isinstance(value, int):
+        int_columns.discard(key)
+    column[row] = value
+
+
+def _flush_columns(columns, int_columns, rows):
+    '''
+    Copy the first rows of each column buffer and reset the buffers for the next chunk.
+    '''
+    data = dict()
+    for key, column in columns.items():
+        values = column[:rows].copy()
+        if key in int_columns and not np.isnan(values).any():
+            values = values.astype(np.int64)
+        data[key] = values
+        column.fill(np.nan)
+    return data
+
+
+def _grow_columns(columns, size):
+    for key, column in columns.items():
+        grown = np.full(size, np.nan, dtype=column.dtype)
+        grown[:len(column)] = column
+        columns[key] = grown
+
+
+def read_key(item):
+    '''
+    Return a 64 bit hash of the name and sequence of a read.
+
+    The mates of a pair share the read name, so the sequence is part of the key. A read
+    reported twice (e.g. with different quality strings) has the same key.
+    '''
+    text = "%s\t%s" % (item.get("name", ""), item.get("seq", ""))
+    return int.from_bytes(hashlib.blake2b(text.encode(), digest_size=8).digest(), "little", signed=True)
+
+
+def read_quality_columns(seq, qv, qv_trimmed):
+    '''
+    Compute the quality columns of a batch of reads with vectorized reductions of their decoded strings.
+
+    Returns
+    -------
+    dict
+        the read_mean_qv, read_min_qv, read_n_count and trimmed_prefix (the trimmed bases at
+        the start of the read) of each read.
+    '''
+    batch = decode_reads(seq, qv)
+    return {"read_mean_qv": mean_qv(batch), "read_min_qv": min_qv(batch), "read_n_count": n_count(batch),
+            "trimmed_prefix": trimmed_prefix(decode_reads(seq, qv_trimmed))}
+
+
+def mutation_chunks(items, chunk_size=100000):
+    '''
+    Convert the reads of a GEAR TelomereMutation output in chunks of SBS and indel events.
+
+    The events of each read are written into preallocated column buffers, so the memory
+    used is bounded by the chunk size. The read strings are not kept: each read has its key
+    (see read_key) and the quality columns computed from its strings, see read_quality_columns.
+
+    Parameters
+    ----------
+    items : iterable
+        the decoded reads.
+    chunk_size : int
+        The number of events in each chunk.
+
+    Returns
+    -------
+    generator
+        data frames with up to chunk_size events (a read is never split across chunks).
+    '''
+    read_columns, read_int_columns = dict(), set()
+    event_columns, event_int_columns = dict(), set()
+    event_read = np.zeros(chunk_size, dtype=np.int64)
+    size = chunk_size
+    n_reads = 0
+    n_events = 0
+    keys, strings = list(), {f: list() for f in ["seq", "qv", "qv_trimmed"]}
+
+    def flush():
+        data = _flush_columns(read_columns, read_int_columns, n_reads)
+        data["read"] = np.array(keys, dtype=np.int64)
+        data.update(read_quality_columns(strings["seq"], strings["qv"], strings["qv_trimmed"]))
+        data = {k: v[event_read[:n_events]] for k, v in data.items()}
+        data.update(_flush_columns(event_columns, event_int_columns, n_events))
+        return pd.DataFrame(data)
+
+    for item in items:
+        events = list()
+        for k, v in item.get("sbs", {}).items():
+            for vv in v:
+                events.append((("kind", "sbs"), ("pos", int(k)), ("ref_pos", vv["pos"]), ("ref_qv", vv["qv"]),
+                               ("mean_qv", vv["mean_qv"]), ("sbs", vv["value"]),
+                               ("is_trimmed", vv["is_trimmed"])))
+        for k, v in item.get("indels", {}).items():
+            for vv in v:
+                events.append((("kind", vv["kind"]), ("pos", int(k)), ("ref_pos", vv["pos"]),
+                               ("mean_qv", vv["mean_qv"]), ("indel", vv["seq"]), ("size", len(vv["seq"])),
+                               ("is_trimmed", vv["is_trimmed"])))
+        if len(events) == 0:
+            continue
+        # emit the chunk before it overflows, a single large read grows the buffers instead
+        if n_events + len(events) > size and n_events > 0:
+            yield flush()
+            n_reads, n_events = 0, 0
+            keys, strings = list(), {f: list() for f in ["seq", "qv", "qv_trimmed"]}
+        if len(events) > size:
+            size = len(events)
+            _grow_columns(read_columns, size)
+            _grow_columns(event_columns, size)
+            event_read = np.resize(event_read, size)
+
+        for k, v in item.items():
+            if k not in ["sbs", "indels"] and k not in READ_STRING_FIELDS:
+                _store_value(read_columns, read_int_columns, k, n_reads, v, size)
+        keys.append(read_key(item))
+        for f in strings:
+            strings[f].append(item.get(f, ""))
+        for event in events:
+            for k, v in event:
+                _store_value(event_columns, event_int_columns, k, n_events, v, size)
+            event_read[n_events] = n_reads
+            n_events += 1
+        n_reads += 1
+
+    if n_events > 0:
+        yield flush()
+
+
+def read_block_chunks(block, input_path, to_chunks):
+    '''
+    Decode one block of an indexed GEAR TelomereMutation output (see gear_io.write_blocked_array)
+    and return the chunks made by to_chunks from its reads.
+    '''
+    return list(to_chunks(read_array_block(input_path, block)))
+
+
+def read_chunks(input_path, to_chunks, block_jobs=1):
+    '''
+    Iterate the chunks made by to_chunks from the reads of a GEAR TelomereMutation output.
+
+    Parameters
+    ----------
+    input_path : str
+        The json file path.
+    to_chunks : callable
+        a picklable function that takes the decoded reads and returns chunks (e.g. data frames).
+    block_jobs : int
+        number of processes decoding the blocks of an indexed file (see IndexGearOutputs.py),
+        the files without a block index are streamed.
+
+    Returns
+    -------
+    generator
+        the chunks, in the order of the reads.
+    '''
+    blocks = read_block_index(input_path) if block_jobs != 1 else None
+    if blocks is None:
+        with GzipTextStream(input_path) as f:
+            for df in to_chunks(iter_json_array(f)):
+                yield df
+    else:
+        for chunks in imap_files(partial(read_block_chunks, input_path=input_path, to_chunks=to_chunks), blocks,
+                                 block_jobs):
+            for df in chunks:
+                yield df
+
+
+def read_gear_mutations(input_path, chunk_size=100000, block_jobs=1):
     '''
     Parse a json file with GEAR file format.
 
@@ -17,34 +231,436 @@ def read_gear_mutations(input_path):
     ----------
     input_path : str
         The json file path.
+    chunk_size : int
+        The number of events parsed at a time.
+    block_jobs : int
+        number of processes decoding the blocks of an indexed file (see IndexGearOutputs.py),
+        the files without a block index are streamed.
 
     Returns
     -------
     pandas.DataFrame
         a data frame with motif count information.
     '''
+    # the reads are decompressed and decoded as they are streamed, the stage includes both
+    with Stage("mutation decode") as stage:
+        data_list = list(read_chunks(input_path, partial(mutation_chunks, chunk_size=chunk_size), block_jobs))
+        stage.rows = sum(len(d) for d in data_list)
+    if len(data_list) == 0:
+        return pd.DataFrame()
+    with Stage("frame building") as stage:
+        df = pd.concat(data_list, ignore_index=True).drop_duplicates()
+        stage.rows = len(df)
+    return df
+
+
+def process_file(gear_file, chunk_size=100000, cache=None, block_jobs=1):
+    logging.info("reading file: %s", gear_file.path)
+    df_tmp = cached_read(cache, read_gear_mutations, gear_file.path, PARSER_VERSION, chunk_size=chunk_size,
+                         block_jobs=block_jobs)
+    df_tmp["sample"] = gear_file.sample_id
+    return df_tmp
+
+
+def read_batch_chunks(items, chunk_size=100000):
+    '''
+    Decode the reads of a GEAR TelomereMutation output in batches of uint8 matrices.
+
+    Parameters
+    ----------
+    items : iterable
+        the decoded reads.
+    chunk_size : int
+        The number of reads in each batch.
+
+    Returns
+    -------
+    generator
+        the (keys, ReadBatch) of each batch, see read_key and read_buffer.decode_reads.
+    '''
+    def flush():
+        return np.array(keys, dtype=np.int64), decode_reads(seq, qv)
+
+    keys, seq, qv = list(), list(), list()
+    for item in items:
+        keys.append(read_key(item))
+        seq.append(item.get("seq", ""))
+        qv.append(item.get("qv", ""))
+        if len(keys) == chunk_size:
+            yield flush()
+            keys, seq, qv = list(), list(), list()
+    if len(keys) > 0:
+        yield flush()
+
+
+def read_gear_reads(input_path, chunk_size=100000, block_jobs=1, packed=False):
+    '''
+    Decode the distinct reads of a GEAR TelomereMutation output in batches of uint8 matrices.
+
+    Parameters
+    ----------
+    input_path : str
+        The json file path.
+    chunk_size : int
+        The number of reads in each batch.
+    block_jobs : int
+        number of processes decoding the blocks of an indexed file (see IndexGearOutputs.py),
+        the files without a block index are streamed.
+    packed : bool
+        if True the bases are packed in 2 bits, see read_buffer.pack_bases.
+
+    Returns
+    -------
+    list
+        the (keys, ReadBatch) of each batch, a read reported twice is kept once.
+    '''
+    seen = set()
+    batches = list()
+    with Stage("read decode") as stage:
+        for keys, batch in read_chunks(input_path, partial(read_batch_chunks, chunk_size=chunk_size), block_jobs):
+            first = np.zeros(len(keys), dtype=bool)
+            for i, key in enumerate(keys.tolist()):
+                if key not in seen:
+                    seen.add(key)
+                    first[i] = True
+            batch = ReadBatch(*(v[first] for v in batch))
+            if packed:
+                batch = batch._replace(seq=pack_bases(batch.seq, batch.lengths))
+            batches.append((keys[first], batch))
+        stage.rows = len(seen)
+    logging.debug("%s: %d reads in %.1f MB", input_path, len(seen),
+                  sum(batch_nbytes(b) for _, b in batches) / 1e6)
+    return batches
+
+
+def read_summary_chunks(items, chunk_size=100000):
+    '''
+    Summarise the reads of a GEAR TelomereMutation output in chunks, without their SBS and indel events.
+
+    Parameters
+    ----------
+    items : iterable
+        the decoded reads.
+    chunk_size : int
+        The number of reads in each chunk.
+
+    Returns
+    -------
+    generator
+        data frames with one row per read: its key (see read_key), the SUMMARY_FIELDS, the bases
+        of each operation of its cs string (CS_FIELDS, see cs_string.parse_cs) and the variant
+        repeat counts (0 for the repeats the read does not have).
+    '''
+    def flush():
+        data = {"read": np.array(keys, dtype=np.int64)}
+        for f in SUMMARY_FIELDS:
+            data[f] = np.array(values[f], dtype=np.int64)
+        bases = operation_bases(parse_cs(cs), len(keys))
+        for f, name in zip(CS_FIELDS, OP_NAMES):
+            data[f] = bases[name]
+        for repeat in sorted(repeats):
+            rows, counts = repeats[repeat]
+            column = np.zeros(len(keys), dtype=np.int64)
+            column[rows] = counts
+            data[repeat] = column
+        return pd.DataFrame(data)
+
+    # the variant repeat counts are the read fields named after a repeat, e.g. TTAGGG
+    is_repeat = dict()
+    keys, values, repeats, cs = list(), {f: list() for f in SUMMARY_FIELDS}, dict(), list()
+    for item in items:
+        row = len(keys)
+        keys.append(read_key(item))
+        cs.append(item.get("cs_str", ""))
+        for f in SUMMARY_FIELDS:
+            values[f].append(item.get(f, 0))
+        for k, v in item.items():
+            if k not in is_repeat:
+                is_repeat[k] = len(k) > 0 and REPEAT_BASES.issuperset(k)
+            if is_repeat[k]:
+                rows, counts = repeats.setdefault(k, (list(), list()))
+                rows.append(row)
+                counts.append(v)
+        if len(keys) == chunk_size:
+            yield flush()
+            keys, values, repeats, cs = list(), {f: list() for f in SUMMARY_FIELDS}, dict(), list()
+    if len(keys) > 0:
+        yield flush()
+
+
+def summarise_reads(chunks):
+    '''
+    Sum the read summaries of a file, counting each read once.
+
+    Parameters
+    ----------
+    chunks : iterable
+        the data frames of read_summary_chunks, consumed one at a time.
+
+    Returns
+    -------
+    dict
+        the number of reads and duplicated reads, the read length (the longest read), the
+        telomere length (mlen) and each variant repeat count summed over the reads.
+    '''
+    seen = set()
+    reads, duplicates, read_length = 0, 0, 0
+    sums = pd.Series(0, index=[f for f in SUMMARY_FIELDS if f != "seq_len"], dtype=np.int64)
+    for df in chunks:
+        first = np.zeros(len(df), dtype=bool)
+        for i, key in enumerate(df["read"].tolist()):
+            if key not in seen:
+                seen.add(key)
+                first[i] = True
+        df = df[first]
+        reads += len(df)
+        duplicates += len(first) - len(df)
+        read_length = max(read_length, int(df["seq_len"].max())) if len(df) > 0 else read_length
+        sums = sums.add(df.drop(columns=["read", "seq_len"]).sum(), fill_value=0)
+    summary = {"reads": reads, "duplicates": duplicates, "read_length": read_length}
+    summary.update((k, int(v)) for k, v in sums.items())
+    return summary
+
+
+def read_gear_telomere_summary(input_path, chunk_size=100000, block_jobs=1):
+    '''
+    Summarise the telomere length and variant repeats of the reads of a GEAR TelomereMutation output.
+
+    The reads are summarised as they are decoded, their SBS and indel events are not converted.
+
+    Parameters
+    ----------
+    input_path : str
+        The json file path.
+    chunk_size : int
+        The number of reads summarised at a time.
+    block_jobs : int
+        number of processes decoding the blocks of an indexed file, see read_chunks.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a single row data frame with the summary of summarise_reads.
+    '''
+    with Stage("read summary") as stage:
+        summary = summarise_reads(read_chunks(input_path, partial(read_summary_chunks, chunk_size=chunk_size),
+                                              block_jobs))
+        stage.rows = summary["reads"]
+    return pd.DataFrame([summary])
+
+
+def process_summary(gear_file, chunk_size=100000, cache=None, block_jobs=1):
+    logging.info("reading file: %s", gear_file.path)
+    df_tmp = cached_read(cache, read_gear_telomere_summary, gear_file.path, SUMMARY_VERSION, chunk_size=chunk_size,
+                         block_jobs=block_jobs)
+    df_tmp["sample_id"] = gear_file.sample_id
+    return df_tmp
+
+
+def telomere_content(df, category_map, sequence_size_map, read_length=None):
+    '''
+    Normalise the telomere length and variant repeats of each sample per Mbp sequenced.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        the read summaries, one row per sample (see read_gear_telomere_summary).
+    category_map, sequence_size_map : dict
+        maps from sample id to category and number of reads.
+    read_length : int
+        the read length, None uses the longest telomeric read of each sample.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the summaries with the category, the sequenced bases (Mbp), the telomere content (telomeric
+        bases per Mbp), the SBS, insertion and deletion rates of the cs strings (bases per aligned
+        reference base) and each variant repeat count per Mbp.
+    '''
+    repeats = sorted(c for c in df.columns if REPEAT_BASES.issuperset(c))
+    df = df.copy()
+    df[repeats] = df[repeats].fillna(0).astype(np.int64)
+    df["category"] = df["sample_id"].map(category_map)
+    df["total_reads"] = df["sample_id"].map(sequence_size_map)
+    if read_length is not None:
+        df["read_length"] = read_length
+    df["mbp"] = df["total_reads"] * df["read_length"] / 1e6
+    df["telomere_content"] = df["mlen"] / df["mbp"]
+    aligned = df["cs_match"] + df["cs_sbs"] + df["cs_del"]
+    for name in ["sbs", "ins", "del"]:
+        df[name + "_rate"] = df["cs_" + name] / aligned
+    for repeat in repeats:
+        df[repeat + "_per_mbp"] = df[repeat] / df["mbp"]
+    columns = ["sample_id", "category", "total_reads", "read_length", "mbp", "reads", "duplicates", "mlen",
+               "telomere_content"] + CS_FIELDS + ["sbs_rate", "ins_rate", "del_rate"]
+    return df[columns + repeats + [r + "_per_mbp" for r in repeats]]
+
+
+# event types of the error profile: the SBS by alternative base, then the insertions and deletions
+PROFILE_EVENTS = ["A", "C", "G", "T", "N", "ins", "del"]
+
+# bases of the error profile, inside and outside the trimmed region [ts, te) of the reads
+PROFILE_TRIMMED = ["untrimmed", "trimmed"]
+
+# event counts by type, trimmed bases and read cycle, and the reads covering each cycle with trimmed and
+# untrimmed bases
+ErrorProfile = namedtuple("ErrorProfile", ["counts", "coverage"])
+
+
+def _pad_cycles(values, cycles):
+    if values.shape[-1] >= cycles:
+        return values
+    return np.pad(values, [(0, 0)] * (values.ndim - 1) + [(0, cycles - values.shape[-1])])
+
+
+def add_profiles(total, profile):
+    '''
+    Sum two error profiles, the shorter one is padded to the read cycles of the longer one (None is empty).
+    '''
+    if total is None:
+        return profile
+    cycles = max(total.counts.shape[-1], profile.counts.shape[-1])
+    return ErrorProfile(_pad_cycles(total.counts, cycles) + _pad_cycles(profile.counts, cycles),
+                        _pad_cycles(total.coverage, cycles) + _pad_cycles(profile.coverage, cycles))
+
+
+def _chunk_profile(codes, trimmed, cycles, lengths, starts, ends):
+    '''
+    Count the events of a chunk of reads into an ErrorProfile.
+    '''
+    cycles = np.frombuffer(cycles, dtype=np.int64)
+    lengths = np.frombuffer(lengths, dtype=np.int64)
+    n = max(int(lengths.max()), int(cycles.max()) + 1 if len(cycles) > 0 else 0)
+    index = (np.frombuffer(codes, dtype=np.int64) * 2 + np.frombuffer(trimmed, dtype=np.int64)) * n + cycles
+    counts = np.bincount(index, minlength=len(PROFILE_EVENTS) * 2 * n).reshape(len(PROFILE_EVENTS), 2, n)
+    # reads longer than each cycle, and reads whose untrimmed bases cover it (interval starts minus ends)
+    covered = np.bincount(lengths, minlength=n + 1)[::-1].cumsum()[::-1][1:]
+    untrimmed = np.cumsum(np.bincount(np.frombuffer(starts, dtype=np.int64), minlength=n + 1) -
+                          np.bincount(np.frombuffer(ends, dtype=np.int64), minlength=n + 1))[:n]
+    return ErrorProfile(counts, np.stack([untrimmed, covered - untrimmed]))
+
+
+def error_profile_chunks(items, chunk_size=100000):
+    '''
+    Count the SBS and indels of the reads of a GEAR TelomereMutation output by read cycle, in chunks.
+
+    The events are binned with a single bincount per chunk, so the profile size depends on the
+    read length and not on the number of events. The read cycle is the position of the event
+    in the read as sequenced: the positions of reverse strand reads are flipped, since their
+    sequence is reverse complemented like in a BAM record. Every read record is counted.
+
+    The events and the coverage are split by the same rule: an event is in the untrimmed bases
+    when its position is within the trimmed region [ts, te) of the read.
+
+    Parameters
+    ----------
+    items : iterable
+        the decoded reads.
+    chunk_size : int
+        The number of reads in each chunk.
+
+    Returns
+    -------
+    generator
+        an ErrorProfile for each chunk: the event counts (PROFILE_EVENTS x PROFILE_TRIMMED x cycles)
+        and the number of reads covering each cycle with trimmed and untrimmed bases
+        (PROFILE_TRIMMED x cycles), from the trimmed region bounds ts and te of the reads.
+    '''
+    event_codes = {e: i for i, e in enumerate(PROFILE_EVENTS)}
+
+    def new_buffers():
+        return [array("q") for _ in range(6)]
+
+    codes, trimmed, cycles, lengths, starts, ends = new_buffers()
+    for item in items:
+        seq_len = item["seq_len"]
+        reverse = item.get("reverse", 0) == 1
+        lengths.append(seq_len)
+        ts, te = item["ts"], item["te"]
+        starts.append(seq_len - te if reverse else ts)
+        ends.append(seq_len - ts if reverse else te)
+        for field, code_key in (("sbs", "value"), ("indels", "kind")):
+            for k, v in item.get(field, {}).items():
+                position = int(k)
+                cycle = seq_len - 1 - position if reverse else position
+                is_trimmed = 0 if ts <= position < te else 1
+                for vv in v:
+                    codes.append(event_codes[vv[code_key]])
+                    trimmed.append(is_trimmed)
+                    cycles.append(cycle)
+        if len(lengths) == chunk_size:
+            yield _chunk_profile(codes, trimmed, cycles, lengths, starts, ends)
+            codes, trimmed, cycles, lengths, starts, ends = new_buffers()
+    if len(lengths) > 0:
+        yield _chunk_profile(codes, trimmed, cycles, lengths, starts, ends)
+
+
+def profile_frame(profile):
+    '''
+    Return an ErrorProfile as a long format data frame: event, trimmed, cycle, count and coverage.
+    '''
+    if profile is None:
+        return pd.DataFrame(columns=["event", "trimmed", "cycle", "count", "coverage"])
+    events, flags, cycles = np.indices(profile.counts.shape).reshape(3, -1)
+    return pd.DataFrame({"event": np.array(PROFILE_EVENTS, dtype=object)[events],
+                         "trimmed": np.array(PROFILE_TRIMMED, dtype=object)[flags],
+                         "cycle": cycles,
+                         "count": profile.counts.reshape(-1),
+                         "coverage": profile.coverage[flags, cycles]})
+
+
+def read_gear_error_profile(input_path, chunk_size=100000, block_jobs=1):
+    '''
+    Build the read cycle error profile of a GEAR TelomereMutation output in a single pass.
+
+    Parameters
+    ----------
+    input_path : str
+        The json file path.
+    chunk_size : int
+        The number of reads binned at a time.
+    block_jobs : int
+        number of processes decoding the blocks of an indexed file, see read_chunks.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the error profile, see profile_frame.
+    '''
+    with Stage("error profile") as stage:
+        profile = None
+        for chunk in read_chunks(input_path, partial(error_profile_chunks, chunk_size=chunk_size), block_jobs):
+            profile = add_profiles(profile, chunk)
+        df = profile_frame(profile)
+        stage.rows = len(df)
+    return df
+
+
+def process_profile(gear_file, chunk_size=100000, cache=None, block_jobs=1):
+    logging.info("reading file: %s", gear_file.path)
+    df_tmp = cached_read(cache, read_gear_error_profile, gear_file.path, PROFILE_VERSION, chunk_size=chunk_size,
+                         block_jobs=block_jobs)
+    df_tmp["sample_id"] = gear_file.sample_id
+    return df_tmp
 
-    # open the input file
-    with gzip.open(input_path) as f:
-        # load the data and create an empty list
-        data = json.load(f)
-        data_list = list()
-        for i, item in enumerate(data):
-            data_dict = {k: v for k, v in item.items() if not k in ["sbs", "indels"]}
-            if "sbs" in item:
-                for k, v in item["sbs"].items():
-                    for vv in v:
-                        data_list.append({**data_dict,
-                                          **{"kind": "sbs", "pos": int(k), "ref_pos": vv["pos"], "ref_qv": vv["qv"],
-                                             "mean_qv": vv["mean_qv"], "sbs": vv["value"],
-                                             "is_trimmed": vv["is_trimmed"]}})
-            if "indels" in item:
-                for k, v in item["indels"].items():
-                    for vv in v:
-                        data_list.append({**data_dict, **{"kind": vv["kind"], "pos": int(k), "ref_pos": vv["pos"],
-                                                          "mean_qv": vv["mean_qv"], "indel": vv["seq"],
-                                                          "size": len(vv["seq"]), "is_trimmed": vv["is_trimmed"]}})
-    return pd.DataFrame(data_list).drop_duplicates()
+
+def cycle_profile(df, by=("category",)):
+    '''
+    Return the rate of each event type by read cycle (events per read covering the cycle), trimmed and
+    untrimmed bases together, to spot the sequencing cycle artefacts.
+    '''
+    df = df.groupby(list(by) + ["event", "cycle"])[["count", "coverage"]].sum().reset_index()
+    df["rate"] = df["count"] / df["coverage"].where(df["coverage"] > 0)
+    return df
+
+
+def trimmed_profile(df, by=("category",)):
+    '''
+    Return the rate of each event type (events per base) in the trimmed and untrimmed bases of the reads.
+    '''
+    df = df.groupby(list(by) + ["event", "trimmed"])[["count", "coverage"]].sum().reset_index()
+    df["rate"] = df["count"] / df["coverage"].where(df["coverage"] > 0)
+    return df
 
 
 if __name__ == "__main__":
@@ -59,6 +675,22 @@ if __name__ == "__main__":
     parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
     parser.add_argument('-o', '--output', type=str, help='Output file', default="../data/")
     parser.add_argument('-i', '--input', type=str, help='Input directory', default="../data/GEAR_TELOMERE_MUTATION/")
+    parser.add_argument('-c', '--chunk_size', type=int, help='Number of reads summarised at a time', default=100000)
+    parser.add_argument('-l', '--read_length', type=int, help='Read length, by default the longest telomeric read '
+                                                              'of each sample', default=None)
+    parser.add_argument('-j', '--jobs', type=int, help='Number of parallel processes (0 uses all the cores)',
+                        default=1)
+    add_cache_arguments(parser)
+    add_manifest_argument(parser)
+    add_format_argument(parser)
+    parser.add_argument('--error_profile', action='store_true', help='Save the SBS and indel rates by read cycle '
+                                                                     'and trimmed bases (an extra pass over the '
+                                                                     'files)')
+    parser.add_argument('--block_jobs', type=int, help='Number of processes decoding the blocks of each indexed '
+                                                       'file, see IndexGearOutputs.py (0 uses all the cores)',
+                        default=1)
+    add_trace_argument(parser)
+    add_json_argument(parser)
 
     # parse arguments and set logger
     args = parser.parse_args()
@@ -77,46 +709,50 @@ if __name__ == "__main__":
     root_logger.addHandler(consoleHandler)
 
     print_cmri_welcome("Mutation Analysis")
+    set_json_decoder(args.json_decoder)
 
     directory_exists(args.input, True)
 
-    data_list = list()
-    for f in find_files(args.input, "json.gz",compressed=True):
-        if "._" in f:
-            continue
-        logging.info("reading file: %s", f)
-        df_tmp = read_gear_mutations(f)
-        D1 = os.path.dirname(f)
-        D2 = os.path.dirname(D1)
-        df_tmp["sample"] = os.path.basename(D2) + os.path.basename(D1)
-
-        data_list.append(df_tmp)
-    df = pd.concat(data_list).reset_index(drop=True)
-
-    variants = [c for c in df.columns if "G" in c]
-
-    df_size = df[["mlen", "name", "seq", "sample"] + variants].drop_duplicates().groupby("sample")[
-        variants + ["mlen"]].sum().reset_index()
-
-    category_map = {
-        "A1L1": "Con"
-        , "A1L2": "Con"
-        , "A2L1": "Con"
-        , "A2L2": "Con"
-        , "A3L1": "MSH6 KO"
-        , "A3L2": "MSH6 KO"
-        , "A4L1": "MSH6 KO"
-        , "A4L2": "MSH6 KO"
-    }
-    sequence_size_map = {
-        "A1L1": 178424347
-        , "A1L2": 173957699
-        , "A2L1": 171704752
-        , "A2L2": 163338462
-        , "A3L1": 171391614
-        , "A3L2": 158500729
-        , "A4L1": 192706327
-        , "A4L2": 179876862
-    }
+    manifest = load_manifest(args.manifest, args.input,
+                             None if args.cache_dir is None else os.path.join(args.cache_dir, "log_totals.json"))
+    category_map = manifest["category"].to_dict()
+    sequence_size_map = manifest["reads"].to_dict()
+
+    # Iterate all the files in path, in a deterministic order, each file is reduced to its read summary
+    file_list = find_gear_files(args.input)
+    data_list = map_files(partial(process_summary, chunk_size=args.chunk_size, cache=cache_config_from_args(args),
+                                  block_jobs=args.block_jobs), file_list, args.jobs)
+    if len(data_list) == 0:
+        logging.error("data does not exists")
+        exit(errno.ENOENT)
+
+    df_content = telomere_content(pd.concat(data_list, ignore_index=True), category_map, sequence_size_map,
+                                  args.read_length)
+    file_name = write_table(df_content, os.path.join(args.output, "df_telomere_content"), args.format)
+    logging.info("Saved table - %s", file_name)
+    for category, content in df_content.groupby("category")["telomere_content"].mean().items():
+        logging.info("Mean telomere content of %s: %.2f telomeric bases per Mbp", category, content)
+    for category, rates in df_content.groupby("category")[["sbs_rate", "ins_rate", "del_rate"]].mean().iterrows():
+        logging.info("Mean SBS / insertion / deletion rates of %s: %.5f / %.5f / %.5f", category, *rates)
+
+    if args.error_profile:
+        data_list = map_files(partial(process_profile, chunk_size=args.chunk_size,
+                                      cache=cache_config_from_args(args), block_jobs=args.block_jobs),
+                              file_list, args.jobs)
+        df_profile = pd.concat(data_list, ignore_index=True)
+        df_profile["category"] = df_profile["sample_id"].map(category_map)
+        file_name = write_table(df_profile, os.path.join(args.output, "df_error_profile"), args.format)
+        logging.info("Saved table - %s", file_name)
+        df_trimmed = trimmed_profile(df_profile).pivot_table(index=["category", "event"], columns="trimmed",
+                                                             values="rate")
+        logging.info("Events per base in the trimmed and untrimmed bases:\n%s", df_trimmed.to_string())
+
+        df_cycle = cycle_profile(df_profile)
+        file_name = write_table(df_cycle, os.path.join(args.output, "df_error_cycle_profile"), args.format)
+        logging.info("Saved table - %s", file_name)
+        df_peak = df_cycle.loc[df_cycle.dropna(subset=["rate"]).groupby(["category", "event"])["rate"].idxmax()]
+        logging.info("Read cycle with the highest rate of each event type:\n%s",
+                     df_peak.set_index(["category", "event"])[["cycle", "rate"]].to_string())
 
+    report_stages(args.trace)
     logging.info("Total computation time: %s", str(pd.to_datetime(time.time(), unit="s") - start_time))
@@ -1,73 +1,181 @@
 import argparse
-import json
 import sys
 import time
-import gzip
+from array import array
+from functools import partial
 
 import numpy as np
 import pandas as pd
 
+from gear_io import *
+from parse_cache import *
+from table_store import *
 from utils import *
 
-
-def read_gear_vca(input_path):
+# increase when the parser output changes, it invalidates the cached files
+PARSER_VERSION = 2
+
+
+# columns decoded from a mutation key
+MUTATION_COLUMNS = ["Type", "SubType", "IndelSize", "RepeatSize", "signature", "filter", "mutation_id"]
+
+
+def decode_mutation(mutation):
+    '''
+    Decode a GEAR mutation key, e.g. C>A_ACA:PASS, AC>CA:NP or DEL_repeats_2_1:FAIL.
+
+    Parameters
+    ----------
+    mutation : str
+        the mutation key.
+
+    Returns
+    -------
+    list
+        the values of MUTATION_COLUMNS, NaN for the fields the key does not have.
+    '''
+    mutation_id = mutation.split(":")[0]
+    mutation_list = mutation_id.split("_")
+    if "INS" in mutation or "DEL" in mutation:
+        signature = "indels"
+    elif len(mutation_list) == 2:
+        signature = "snp"
+    else:
+        signature = "dnp"
+    fields = mutation_list[:4] + [np.nan] * (4 - len(mutation_list[:4]))
+    return fields + [signature, mutation.split(":")[-1], mutation_id]
+
+
+@Stage("frame building")
+def parse_vca(data):
+    '''
+    Decode the mutation counts of a GEAR VariantCallAnalysis file.
+
+    The mutation keys are decoded once into a vocabulary and only the non zero counts are
+    kept, as integer arrays of region, mutation and sample codes.
+
+    Parameters
+    ----------
+    data : dict
+        the decoded GEAR json, a map {chromosome: list of regions}.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a data frame with one row per region, mutation and sample with a non zero count.
+    '''
     name_map = {'q_telomere': "telomere", 'inner_non_telomeric': "non_telomeric", 'p_telomere': "telomere",
                 "mapq_fail_": "mapq_fail_", "other_": "other_", "qv_fail_": "qv_fail", "unmapped_": "unmapped"}
-    with gzip.open(input_path) as f:
-        data = json.load(f)
-        data_list = list()
-        for chromosome, clist in data.items():
-            for item in clist:
-                name = item["name"]
-                for mutation, sample_data in item["mutations"].items():
-                    mutation_id = mutation.split(":")[0]
-                    mutation_list = mutation_id.split("_")
-                    if "INS" in mutation or "DEL" in mutation:
-                        signature = "indels"
-                    elif len(mutation_list) == 2:
-                        signature = "snp"
-                    else:
-                        signature = "dnp"
-
-                    filter_key = mutation.split(":")[-1]
-                    for k, v in sample_data.items():
-                        mutation_type = mutation_list[0]
-                        mutation_subtype = np.nan if len(mutation_list) < 2 else mutation_list[1]
-                        mutation_indel_size = np.nan if len(mutation_list) < 3 else mutation_list[2]
-                        mutation_repeat_size = np.nan if len(mutation_list) < 4 else mutation_list[3]
-                        data_list.append({
-                            "chromosome": chromosome
-                            , "name": name_map[name]
-                            , "Type": mutation_type
-                            , "SubType": mutation_subtype
-                            , "IndelSize": mutation_indel_size
-                            , "RepeatSize": mutation_repeat_size
-                            , 'signature': signature
-                            , "filter": filter_key
-                            , "mutation_id": mutation_id
-                            , "sample": k
-                            , "count": v})
-        return pd.DataFrame(data_list).query("count != 0")
-
-
-def calculate_percentage(x):
-    x["percentage"] = x["count"] / x["count"].sum()
-    return x
-
-
-def split_dnp(ds):
-    ds["left"] = ds["Type"].split(">")[0]
-    ds["right"] = ds["Type"].split(">")[1]
-    return ds
-
-
-def split_indels(ds):
-    mutation_id = ds["mutation_id"].split("_")
-    ds["Type"] = mutation_id[0]
-    ds["SubType"] = mutation_id[1]
-    ds["Length"] = mutation_id[2]
-    ds["RepeatSize"] = mutation_id[3]
-    return ds
+    regions = list()
+    vocabulary = dict()
+    samples = dict()
+    region_codes, mutation_codes, sample_codes, counts = array("q"), array("q"), array("q"), array("q")
+    for chromosome, clist in data.items():
+        for item in clist:
+            regions.append((chromosome, name_map[item["name"]]))
+            region_code = len(regions) - 1
+            for mutation, sample_data in item["mutations"].items():
+                values = list(sample_data.values())
+                # most of the mutations have no counts
+                if not any(values):
+                    continue
+                mutation_code = vocabulary.setdefault(mutation, len(vocabulary))
+                for k, v in zip(sample_data, values):
+                    if v != 0:
+                        region_codes.append(region_code)
+                        mutation_codes.append(mutation_code)
+                        sample_codes.append(samples.setdefault(k, len(samples)))
+                        counts.append(v)
+
+    columns = ["chromosome", "name"] + MUTATION_COLUMNS + ["sample", "count"]
+    if len(counts) == 0:
+        return pd.DataFrame(columns=columns)
+
+    region_codes = np.frombuffer(region_codes, dtype=np.int64)
+    mutation_codes = np.frombuffer(mutation_codes, dtype=np.int64)
+    region_table = np.array(regions, dtype=object).reshape(-1, 2)
+    mutation_table = np.array([decode_mutation(m) for m in vocabulary], dtype=object)
+
+    df = dict()
+    df["chromosome"] = region_table[region_codes, 0]
+    df["name"] = region_table[region_codes, 1]
+    for i, c in enumerate(MUTATION_COLUMNS):
+        df[c] = mutation_table[mutation_codes, i]
+    df["sample"] = np.array(list(samples), dtype=object)[np.frombuffer(sample_codes, dtype=np.int64)]
+    df["count"] = np.frombuffer(counts, dtype=np.int64)
+    return pd.DataFrame(df, columns=columns)
+
+
+def read_gear_vca(input_path):
+    '''
+    Parse a json file with GEAR VariantCallAnalysis format.
+
+    Parameters
+    ----------
+    input_path : str
+        The json file path.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a data frame with one row per region, mutation and sample with a non zero count.
+    '''
+    return parse_vca(read_gear_json(input_path))
+
+
+def process_file(gear_file, cache=None):
+    logging.info("Processing file %s", gear_file.path)
+    df_tmp = cached_read(cache, read_gear_vca, gear_file.path, PARSER_VERSION)
+    df_tmp["group"] = gear_file.sample_id
+    return df_tmp
+
+
+def calculate_percentage(df, by="group"):
+    '''
+    Add the count of each row as a fraction of the total count of its group.
+    '''
+    df["percentage"] = df["count"] / df.groupby(by)["count"].transform("sum")
+    return df
+
+
+def split_column(df, column, sep, names):
+    '''
+    Split a text column into new columns, each distinct value is split only once.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        the data frame.
+    column : str
+        the column to split.
+    sep : str
+        the separator.
+    names : list
+        the names of the new columns, one per field.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the data frame with the new columns.
+    '''
+    if len(df) == 0:
+        # no value to split, the new columns are empty
+        for name in names:
+            df[name] = pd.Series(dtype=object, index=df.index)
+        return df
+    codes, uniques = pd.factorize(df[column])
+    fields = pd.Series(uniques, dtype=object).str.split(sep, expand=True)
+    for i, name in enumerate(names):
+        df[name] = fields[i].values[codes]
+    return df
+
+
+def split_dnp(df):
+    return split_column(df, "Type", ">", ["left", "right"])
+
+
+def split_indels(df):
+    return split_column(df, "mutation_id", "_", ["Type", "SubType", "Length", "RepeatSize"])
 
 
 if __name__ == "__main__":
@@ -85,6 +193,12 @@ if __name__ == "__main__":
     parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
     parser.add_argument('-o', '--output', type=str, help='Output file', default="../data/")
     parser.add_argument('-i', '--input', type=str, help='Input directory', default="../data/GEAR_VCA/")
+    parser.add_argument('-j', '--jobs', type=int, help='Number of parallel processes (0 uses all the cores)',
+                        default=1)
+    add_cache_arguments(parser)
+    add_format_argument(parser)
+    add_trace_argument(parser)
+    add_json_argument(parser)
 
     # parse arguments and set logger
     args = parser.parse_args()
@@ -100,44 +214,41 @@ if __name__ == "__main__":
     root_logger.addHandler(consoleHandler)
 
     print_cmri_welcome("Mutation Analysis")
+    set_json_decoder(args.json_decoder)
 
     directory_exists(args.input, True)
 
-    data_list = list()
-    for f in find_files(args.input, "json.gz",compressed=True):
-        if os.path.basename(f)[0] == ".":
-            continue
-        logging.info("Processing file %s", f)
-        df_tmp = read_gear_vca(f)
-        df_tmp["group"] = f.split("/")[-2]
-        data_list.append(df_tmp)
+    # Iterate all the files in path, in a deterministic order
+    file_list = find_gear_files(args.input)
+    data_list = map_files(partial(process_file, cache=cache_config_from_args(args)), file_list, args.jobs)
 
     if len(data_list) ==0:
         logging.error("data does not exists")
         exit(-1)
 
-    df = pd.concat(data_list)
-    df_snp = df.query("signature=='snp'").groupby(["Type", "SubType", "group"])["count"].sum().reset_index().groupby(
-        "group").apply(calculate_percentage)
-    file_name=os.path.join(args.output, "df_snp.csv")
-    df_snp.to_csv(file_name)
-    logging.info("Saved csv - %s", file_name)
-
-    df_dnp = df.query("signature=='dnp'").groupby(["Type", "group"])["count"].sum().reset_index().groupby(
-        "group").apply(calculate_percentage)
-    df_dnp = df_dnp.apply(split_dnp, axis=1)
-    file_name=os.path.join(args.output, "df_dnp.csv")
-    df_dnp.to_csv(file_name)
-    logging.info("Saved csv - %s", file_name)
-
-
-    df_indels = df.query("signature=='indels'").groupby(["mutation_id", "group"])["count"].sum().reset_index().groupby(
-        "group").apply(calculate_percentage)
-    df_indels = df_indels.apply(split_indels, axis=1)
-    file_name=os.path.join(args.output, "df_indels.csv")
-    df_indels.to_csv(file_name)
-    logging.info("Saved csv - %s", file_name)
-
-
+    with Stage("concat"):
+        df = pd.concat(data_list)
+    with Stage("group-by"):
+        df_snp = calculate_percentage(
+            df.query("signature=='snp'").groupby(["Type", "SubType", "group"])["count"].sum().reset_index())
+    file_name = write_table(df_snp, os.path.join(args.output, "df_snp"), args.format)
+    logging.info("Saved table - %s", file_name)
+
+    with Stage("group-by"):
+        df_dnp = calculate_percentage(
+            df.query("signature=='dnp'").groupby(["Type", "group"])["count"].sum().reset_index())
+    df_dnp = split_dnp(df_dnp)
+    file_name = write_table(df_dnp, os.path.join(args.output, "df_dnp"), args.format)
+    logging.info("Saved table - %s", file_name)
+
+
+    with Stage("group-by"):
+        df_indels = calculate_percentage(
+            df.query("signature=='indels'").groupby(["mutation_id", "group"])["count"].sum().reset_index())
+    df_indels = split_indels(df_indels)
+    file_name = write_table(df_indels, os.path.join(args.output, "df_indels"), args.format)
+    logging.info("Saved table - %s", file_name)
+
+    report_stages(args.trace)
 
     logging.info("Total computation time: %s", str(pd.to_datetime(time.time(), unit="s") - start_time))
@@ -0,0 +1,117 @@
+from collections import namedtuple
+
+import numpy as np
+
+# operation codes of a cs string (minimap2 --cs): a run of matches (:6 or =ACGTAC in the long
+# form), a substitution (*gt, reference base then read base), an insertion (+ag) and a deletion (-ag)
+OP_MATCH, OP_SBS, OP_INS, OP_DEL = 0, 1, 2, 3
+OP_NAMES = ["match", "sbs", "ins", "del"]
+
+# the operations of a batch of cs strings as flat arrays, one item per operation: the read
+# (index of its cs string), the operation code and length, the reference and read bases
+# (upper case ASCII codes, 0 if the operation has none; the first base of an indel) and the
+# offset of the operation from the start of the alignment in the read and in the reference
+CsOps = namedtuple("CsOps", ["read", "op", "length", "ref", "alt", "offset", "ref_offset"])
+
+# the strings are joined with a separator that ends each read, tokenised like an operation
+_END = 4
+_SEPARATOR = "\n"
+_LONG_MATCH = 5
+_NONE = -1
+
+_TOKENS = np.full(256, _NONE, dtype=np.int8)
+for _char, _code in ((":", OP_MATCH), ("*", OP_SBS), ("+", OP_INS), ("-", OP_DEL), (_SEPARATOR, _END),
+                     ("=", _LONG_MATCH)):
+    _TOKENS[ord(_char)] = _code
+_IS_DIGIT = np.zeros(256, dtype=bool)
+_IS_DIGIT[ord("0"):ord("9") + 1] = True
+
+
+def parse_cs(strings):
+    '''
+    Tokenise a batch of cs strings into flat arrays of operations.
+
+    The strings are joined in one buffer and tokenised with vectorized operations on its bytes:
+    each operation starts at its operator character, the match runs are read from their digits
+    and the offsets are the cumulative lengths of the operations of each read.
+
+    Parameters
+    ----------
+    strings : list
+        the cs strings, e.g. :5*gt:2*at:117. The spliced alignments (~) are not supported.
+
+    Returns
+    -------
+    CsOps
+        the operations, in the order of the strings.
+    '''
+    text = np.frombuffer((_SEPARATOR.join(strings) + _SEPARATOR).encode("ascii") if len(strings) > 0 else b"",
+                         dtype=np.uint8)
+    if (text == ord("~")).any():
+        raise ValueError("Spliced cs strings (~) are not supported")
+    is_token = _TOKENS[text] != _NONE
+    starts = np.flatnonzero(is_token)
+    if len(text) > 0 and not is_token[0]:
+        raise ValueError("Invalid cs string, it does not start with an operation: %s" % strings[0])
+
+    codes = _TOKENS[text[starts]]
+    sizes = np.diff(np.append(starts, len(text))) - 1
+    if (sizes[codes == _END] > 0).any() or (sizes[codes != _END] == 0).any():
+        raise ValueError("Invalid cs string, an operation has no value")
+
+    # the match runs, from the digits following each colon
+    token = np.cumsum(is_token) - 1
+    digits = (codes[token] == OP_MATCH) & ~is_token
+    if not _IS_DIGIT[text[digits]].all():
+        raise ValueError("Invalid cs string, a match run is not a number")
+    positions = np.flatnonzero(digits)
+    digit_token = token[positions]
+    place = np.power(10, starts[digit_token] + sizes[digit_token] - positions, dtype=np.int64)
+    runs = np.bincount(digit_token, weights=(text[positions] - ord("0")) * place, minlength=len(starts))
+
+    is_sbs = codes == OP_SBS
+    if (sizes[is_sbs] != 2).any():
+        raise ValueError("Invalid cs string, a substitution is not a pair of bases")
+    lengths = np.where(codes == OP_MATCH, runs.astype(np.int64), np.where(is_sbs, 1, sizes))
+    codes = np.where(codes == _LONG_MATCH, OP_MATCH, codes)
+
+    # first base of the value, upper case
+    first = text[np.minimum(starts + 1, len(text) - 1)] & 0xDF
+    ref = np.where(is_sbs | (codes == OP_DEL), first, 0).astype(np.uint8)
+    alt = np.where(codes == OP_INS, first, 0).astype(np.uint8)
+    alt[is_sbs] = text[starts[is_sbs] + 2] & 0xDF
+
+    # the offsets restart at each read, the end tokens consume nothing
+    is_end = codes == _END
+    read_lengths = np.where((codes == OP_DEL) | is_end, 0, lengths)
+    ref_lengths = np.where((codes == OP_INS) | is_end, 0, lengths)
+    read = np.cumsum(is_end) - is_end
+    offset, ref_offset = [np.cumsum(v) - v for v in (read_lengths, ref_lengths)]
+    read_start = offset[is_end] + read_lengths[is_end]
+    ref_start = ref_offset[is_end] + ref_lengths[is_end]
+    offset -= np.append(0, read_start[:-1])[read]
+    ref_offset -= np.append(0, ref_start[:-1])[read]
+
+    keep = ~is_end
+    return CsOps(read[keep], codes[keep].astype(np.uint8), lengths[keep].astype(np.int32), ref[keep], alt[keep],
+                 offset[keep].astype(np.int32), ref_offset[keep].astype(np.int32))
+
+
+def operation_bases(ops, reads):
+    '''
+    Sum the bases of each operation of a batch by read.
+
+    Parameters
+    ----------
+    ops : CsOps
+        the operations, see parse_cs.
+    reads : int
+        the number of reads of the batch.
+
+    Returns
+    -------
+    dict
+        the (reads,) number of bases of each operation, by operation name.
+    '''
+    return {name: np.bincount(ops.read[ops.op == code], weights=ops.length[ops.op == code],
+                              minlength=reads).astype(np.int64) for code, name in enumerate(OP_NAMES)}
@@ -0,0 +1,182 @@
+import argparse
+import importlib
+import sys
+import time
+
+from utils import *
+
+# modules used to draw the figures, imported after the arguments are parsed (the figure scripts
+# import them inside their render function) so that e.g. -h does not pay their import time
+PLOTTING_MODULES = ["numpy", "pandas", "matplotlib", "matplotlib.pyplot", "seaborn"]
+
+# formats of the input tables (table_store.TABLE_FORMATS, the module imports pandas so it is
+# imported after the arguments are parsed too)
+TABLE_FORMAT_NAMES = ["csv", "parquet", "feather"]
+
+# non-interactive backend, the figures are only saved to files
+BACKEND = "Agg"
+
+
+def add_figure_arguments(parser, output):
+    parser.add_argument('-s', '--silent', action='store_true', help='Starts in silent mode, no message will be output.')
+    parser.add_argument('-d', '--debug', action='store_true', help='Shows debug info')
+    parser.add_argument('-o', '--output', type=str, help='Output file', default=output)
+    add_input_format_argument(parser)
+    parser.add_argument('--profile-startup', action='store_true', help='Report the import time of the plotting '
+                                                                       'modules')
+    add_trace_argument(parser)
+
+
+def add_input_format_argument(parser):
+    parser.add_argument('-f', '--format', type=str, choices=TABLE_FORMAT_NAMES, default="csv",
+                        help='Format read first when an input table is saved in several formats')
+
+
+def set_console_logger(args):
+    '''
+    Add the console handler to the CMRI logger, once per process.
+    '''
+    root_logger, log_formatter = get_cmri_logger()
+    if args.debug:
+        root_logger.setLevel(logging.DEBUG)
+
+    for handler in root_logger.handlers:
+        if getattr(handler, "cmri_console", False):
+            handler.setLevel(logging.ERROR if args.silent else logging.NOTSET)
+            return
+
+    consoleHandler = logging.StreamHandler(sys.stdout)
+    consoleHandler.cmri_console = True
+    if args.silent:
+        consoleHandler.setLevel(logging.ERROR)
+    consoleHandler.setFormatter(log_formatter)
+    root_logger.addHandler(consoleHandler)
+
+
+def import_plotting(modules=PLOTTING_MODULES):
+    '''
+    Import the plotting modules with the non-interactive backend.
+
+    The modules already imported by the process cost nothing, so several figures rendered in
+    the same process pay the import time once.
+
+    Returns
+    -------
+    dict
+        the import time in seconds of each module.
+    '''
+    timings = dict()
+    for name in modules:
+        start = time.perf_counter()
+        module = importlib.import_module(name)
+        if name == "matplotlib":
+            module.use(BACKEND, force=True)
+        timings[name] = time.perf_counter() - start
+    return timings
+
+
+def report_startup(timings, startup):
+    logging.info("Startup (arguments and logger): %.3f s", startup)
+    for name, seconds in timings.items():
+        logging.info("Import %-20s %.3f s", name, seconds)
+    logging.info("Import total: %.3f s", sum(timings.values()))
+
+
+def without_error_bars():
+    '''
+    Return the bar plot argument that turns off the seaborn bootstrap of the error bars (errorbar
+    since seaborn 0.12, ci before), they are drawn from the intervals of BootstrapIntervals.py.
+    '''
+    import seaborn as sns
+    version = tuple(int(v) for v in sns.__version__.split(".")[:2])
+    return {"errorbar": None} if version >= (0, 12) else {"ci": None}
+
+
+def draw_error_bars(ax, positions, low, high, capsize=0.15, orient="v"):
+    '''
+    Draw precomputed error bars with caps on a bar plot, like the seaborn bootstrap error bars.
+
+    Parameters
+    ----------
+    ax : matplotlib.axes.Axes
+        the bar plot.
+    positions : list
+        the centers of the bars on the categorical axis.
+    low, high : list
+        the bounds of each interval, the bars with a missing bound have no error bar.
+    capsize : float
+        the width of the caps, in units of the categorical axis.
+    orient : str
+        v for vertical bars, h for horizontal bars.
+    '''
+    import matplotlib as mpl
+    style = {"color": ".26", "linewidth": mpl.rcParams["lines.linewidth"] * 1.8}
+    for at, ci_low, ci_high in zip(positions, low, high):
+        if ci_low != ci_low or ci_high != ci_high:
+            continue
+        lines = [([at, at], [ci_low, ci_high]), ([at - capsize / 2, at + capsize / 2], [ci_low, ci_low]),
+                 ([at - capsize / 2, at + capsize / 2], [ci_high, ci_high])]
+        # the limits of the categorical axis are set by the bar plot
+        for x, y in lines:
+            if orient == "v":
+                ax.plot(x, y, scalex=False, **style)
+            else:
+                ax.plot(y, x, scaley=False, **style)
+
+
+def render_figure(render, args):
+    '''
+    Call a render function, restoring the style settings and releasing the figures afterwards
+    since other figures may be rendered by the same process.
+    '''
+    import matplotlib
+    import matplotlib.pyplot as plt
+    with matplotlib.rc_context():
+        try:
+            render(args)
+        finally:
+            plt.close("all")
+
+
+def run_figure(name, output, render, argv=None, report=True):
+    '''
+    Parse the arguments of a figure script and render the figure.
+
+    Parameters
+    ----------
+    name : str
+        the figure name, e.g. Fig 2A.
+    output : str
+        the default output file.
+    render : callable
+        a function that takes the parsed arguments and saves the figure.
+    argv : list
+        the command line arguments, None uses sys.argv.
+    report : bool
+        if True log the stages of the render (and save them with --trace).
+    '''
+    # store start time for benchmarking
+    start_time = time.time()
+
+    parser = argparse.ArgumentParser(description='Render %s' % name, epilog=epilog_text,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    add_figure_arguments(parser, output)
+    args = parser.parse_args(argv)
+    set_console_logger(args)
+
+    print_cmri_welcome(name)
+
+    startup = time.time() - start_time
+    timings = import_plotting()
+    if args.profile_startup:
+        report_startup(timings, startup)
+
+    import pandas as pd
+    from table_store import set_table_format
+    set_table_format(args.format)
+    render_figure(render, args)
+
+    if report:
+        report_stages(args.trace)
+
+    logging.info("Total computation time: %s", str(pd.Timedelta(seconds=time.time() - start_time)))
@@ -0,0 +1,293 @@
+import codecs
+import gzip
+import json
+import logging
+import os
+import queue
+import threading
+import zlib
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from utils import Stage, iter_json_array
+
+# json decoders of the GEAR outputs, by default the fastest one installed
+JSON_DECODERS = {"json": json.loads}
+if orjson is not None:
+    JSON_DECODERS["orjson"] = orjson.loads
+
+_json_decoder = "orjson" if orjson is not None else "json"
+
+# gzip header and trailer, zlib also reads the BGZF extra field
+GZIP_WBITS = zlib.MAX_WBITS | 16
+
+# copy of a GEAR output recompressed in blocks and its block index, saved next to the output (the
+# copy does not match *.json.gz, so it is not found as another output), see write_blocked_array
+BLOCKED_EXTENSION = ".blocks.gz"
+BLOCK_INDEX_EXTENSION = ".blocks.json"
+BLOCK_INDEX_VERSION = 2
+
+
+def add_json_argument(parser):
+    parser.add_argument('--json_decoder', type=str, choices=["auto"] + sorted(JSON_DECODERS), default="auto",
+                        help='Decoder of the GEAR json outputs, auto uses orjson if it is installed')
+
+
+def set_json_decoder(name):
+    '''
+    Select the json decoder of the process, auto keeps the default one.
+    '''
+    global _json_decoder
+    if name != "auto":
+        _json_decoder = name
+    logging.debug("JSON decoder: %s", _json_decoder)
+
+
+def json_loads(content):
+    '''
+    Decode a json document (str or UTF-8 bytes) with the selected decoder.
+    '''
+    return JSON_DECODERS[_json_decoder](content)
+
+
+def decompress_blocks(path, block_size=1 << 18):
+    '''
+    Iterate the decompressed content of a gzip file.
+
+    The concatenated gzip members of a file (e.g. BGZF or a file recompressed in blocks)
+    are read in sequence, like gzip.open does.
+
+    Parameters
+    ----------
+    path : str
+        the gzip file.
+    block_size : int
+        number of compressed bytes read at a time.
+
+    Returns
+    -------
+    generator
+        the decompressed bytes, block by block.
+    '''
+    with open(path, "rb") as f:
+        decompressor = zlib.decompressobj(GZIP_WBITS)
+        in_member = False
+        while True:
+            data = f.read(block_size)
+            if len(data) == 0:
+                break
+            while len(data) > 0:
+                in_member = True
+                output = decompressor.decompress(data)
+                if len(output) > 0:
+                    yield output
+                if decompressor.eof:
+                    # the next member starts in the unused data
+                    data = decompressor.unused_data
+                    decompressor = zlib.decompressobj(GZIP_WBITS)
+                    in_member = False
+                else:
+                    data = b""
+    if in_member:
+        raise EOFError("Compressed file ended before the end-of-stream marker was reached: %s" % path)
+
+
+def read_gear_json(path):
+    '''
+    Decompress and decode a GEAR json output.
+    '''
+    with Stage("decompression"):
+        content = b"".join(decompress_blocks(path))
+    with Stage("json decode"):
+        return json_loads(content)
+
+
+class GzipTextStream:
+    '''
+    Read a gzip file as text, decompressed by a background thread ahead of the reader.
+
+    zlib releases the GIL while it decompresses, so the decompression of the next blocks
+    overlaps the decoding of the current one. At most queue_size blocks are held in memory.
+
+    Parameters
+    ----------
+    path : str
+        the gzip file.
+    block_size : int
+        number of compressed bytes decompressed at a time.
+    queue_size : int
+        number of decompressed blocks read ahead.
+    '''
+
+    def __init__(self, path, block_size=1 << 18, queue_size=4):
+        self.blocks = queue.Queue(queue_size)
+        self.decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.eof = False
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self._decompress, args=(path, block_size), daemon=True)
+        self.thread.start()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _put(self, item):
+        # give up if the reader is closed before the end of the file
+        while not self.closed.is_set():
+            try:
+                self.blocks.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def _decompress(self, path, block_size):
+        try:
+            for block in decompress_blocks(path, block_size):
+                if not self._put(block):
+                    return
+            self._put(None)
+        except Exception as e:
+            # raised by the reader
+            self._put(e)
+
+    def read(self, size=-1):
+        '''
+        Return up to size characters, all the remaining ones if size is negative, "" at the end of the file.
+        '''
+        while not self.eof and (size < 0 or len(self.buffer) < size):
+            block = self.blocks.get()
+            if isinstance(block, Exception):
+                raise block
+            if block is None:
+                self.eof = True
+                self.buffer += self.decoder.decode(b"", final=True)
+            else:
+                self.buffer += self.decoder.decode(block)
+        if size < 0 or size >= len(self.buffer):
+            text, self.buffer = self.buffer, ""
+        else:
+            text, self.buffer = self.buffer[:size], self.buffer[size:]
+        return text
+
+    def close(self):
+        self.closed.set()
+        self.thread.join()
+
+
+def blocked_file(path):
+    return path + BLOCKED_EXTENSION
+
+
+def block_index_file(path):
+    return path + BLOCK_INDEX_EXTENSION
+
+
+def read_block_index(path):
+    '''
+    Return the blocks of the copy of a GEAR output recompressed with write_blocked_array.
+
+    Returns
+    -------
+    list
+        the (offset, size, items) of each block, None if the output has no index or the index
+        does not match the output or its copy.
+    '''
+    index_file = block_index_file(path)
+    if not os.path.exists(index_file) or not os.path.exists(blocked_file(path)):
+        return None
+    with open(index_file) as f:
+        index = json.load(f)
+    if index.get("version") != BLOCK_INDEX_VERSION or index.get("size") != os.path.getsize(path) or \
+            index.get("blocked_size") != os.path.getsize(blocked_file(path)):
+        logging.warning("Ignoring the outdated block index %s", index_file)
+        return None
+    return [tuple(block) for block in index["blocks"]]
+
+
+def write_blocked_array(path, block_items=10000, compress_level=6):
+    '''
+    Save a copy of a GEAR output with a top level json array recompressed in independent gzip members and their index.
+
+    Each member holds block_items items of the array (the first one also holds the opening
+    bracket and the last one the closing bracket), so the copy is a valid gzip file with the
+    same json array and each block can be decoded on its own, see read_array_block. The
+    output is left unchanged, the copy (see blocked_file) is renamed once it is fully written.
+
+    Parameters
+    ----------
+    path : str
+        the GEAR output (json.gz).
+    block_items : int
+        number of array items of each block.
+    compress_level : int
+        gzip compression level.
+
+    Returns
+    -------
+    list
+        the (offset, size, items) of each block.
+    '''
+    tmp_file = blocked_file(path) + ".tmp"
+    blocks = list()
+    try:
+        with GzipTextStream(path) as stream, open(tmp_file, "wb") as output:
+            def write_block(text, items):
+                data = gzip.compress(text.encode(), compresslevel=compress_level, mtime=0)
+                blocks.append((output.tell(), len(data), items))
+                output.write(data)
+
+            items = list()
+            for item in iter_json_array(stream, raw=True):
+                items.append(item)
+                if len(items) == block_items:
+                    write_block(("[" if len(blocks) == 0 else ",") + ",".join(items), len(items))
+                    items = list()
+            if len(items) > 0 or len(blocks) == 0:
+                write_block(("[" if len(blocks) == 0 else ",") + ",".join(items) + "]", len(items))
+            else:
+                # the items fill the previous blocks, the last block only closes the array
+                write_block("]", 0)
+        os.replace(tmp_file, blocked_file(path))
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+    with open(block_index_file(path), "w") as f:
+        json.dump({"version": BLOCK_INDEX_VERSION, "size": os.path.getsize(path),
+                   "blocked_size": os.path.getsize(blocked_file(path)), "blocks": blocks}, f)
+    return blocks
+
+
+def read_array_block(path, block):
+    '''
+    Decode the items of one block of the copy of a GEAR output recompressed with write_blocked_array.
+
+    Parameters
+    ----------
+    path : str
+        the GEAR output.
+    block : tuple
+        the (offset, size, items) of the block, see read_block_index.
+
+    Returns
+    -------
+    list
+        the decoded items of the block.
+    '''
+    offset, size, _ = block
+    with open(blocked_file(path), "rb") as f:
+        f.seek(offset)
+        text = zlib.decompress(f.read(size), GZIP_WBITS)
+    # a block is a part of the array, strip its delimiters and decode its items as an array
+    if text[:1] in (b"[", b","):
+        text = text[1:]
+    if text[-1:] == b"]":
+        text = text[:-1]
+    return json_loads(b"[" + text + b"]")
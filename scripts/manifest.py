@@ -0,0 +1,148 @@
+import errno
+import json
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from utils import file_exists, find_gear_files
+
+try:
+    import yaml
+except ImportError:
+    yaml = None
+
+TOTAL_READS_FIELD = "Total sequences analysed:"
+
+MANIFEST_COLUMNS = ["sample", "lane", "category", "reads"]
+
+
+def add_manifest_argument(parser):
+    parser.add_argument('-m', '--manifest', type=str, help='Sample manifest (tsv or yaml) with the sample, lane, '
+                                                           'category and reads of each lane',
+                        default="../data/manifest.tsv")
+
+
+def scan_log_total(log_path, tail_size=4096):
+    '''
+    Return the number of sequences analysed reported in a GEAR log.
+
+    The field is written at the end of the log, so only the tail of the file is read
+    (the whole file is scanned if the tail does not have it).
+
+    Parameters
+    ----------
+    log_path : str
+        a path to GEAR's log output.
+    tail_size : int
+        number of bytes read from the end of the file.
+
+    Returns
+    -------
+    int
+        the number of sequences, None if the log does not report it.
+    '''
+    with open(log_path, "rb") as f:
+        size = f.seek(0, os.SEEK_END)
+        for offset in [max(size - tail_size, 0), 0]:
+            f.seek(offset)
+            total = None
+            for l in f.read().decode(errors="replace").splitlines():
+                if TOTAL_READS_FIELD in l:
+                    total = int(l.split(" ")[-1])
+            if total is not None or offset == 0:
+                return total
+
+
+def scan_log_totals(input_path, jobs=8, cache_file=None):
+    '''
+    Return the number of sequences analysed of each lane, scanning the GEAR logs concurrently.
+
+    Parameters
+    ----------
+    input_path : str
+        a directory with GEAR outputs.
+    jobs : int
+        number of threads reading logs.
+    cache_file : str
+        a json file with the totals of previous scans, keyed by log path, size and
+        modification time. None disables the cache.
+
+    Returns
+    -------
+    dict
+        a dictionary with pairs {sample_id: count}.
+    '''
+    cache = dict()
+    if cache_file is not None and file_exists(cache_file):
+        with open(cache_file) as f:
+            cache = json.load(f)
+
+    log_files = find_gear_files(input_path, ["*.log"])
+    keys = ["%s:%d:%d" % (os.path.abspath(g.path), g.size, os.stat(g.path).st_mtime_ns) for g in log_files]
+    missing = [(g, k) for g, k in zip(log_files, keys) if k not in cache]
+    with ThreadPoolExecutor(max_workers=jobs) as executor:
+        for (g, k), total in zip(missing, executor.map(scan_log_total, [g.path for g, _ in missing])):
+            cache[k] = total
+
+    if cache_file is not None and len(missing) > 0:
+        with open(cache_file, "w") as f:
+            json.dump(cache, f)
+
+    return {g.sample_id: cache[k] for g, k in zip(log_files, keys) if cache[k] is not None}
+
+
+def read_manifest_file(manifest_path):
+    '''
+    Read a manifest file, either a tsv with MANIFEST_COLUMNS or a yaml map {sample: {lane: {category, reads}}}.
+    '''
+    if manifest_path.endswith((".yaml", ".yml")):
+        if yaml is None:
+            logging.error("Reading %s requires pyyaml", manifest_path)
+            exit(errno.EINVAL)
+        with open(manifest_path) as f:
+            data = yaml.safe_load(f)
+        rows = [[str(sample), str(lane), values.get("category"), values.get("reads")]
+                for sample, lanes in data.items() for lane, values in lanes.items()]
+        return pd.DataFrame(rows, columns=MANIFEST_COLUMNS)
+    return pd.read_csv(manifest_path, sep="\t", dtype={"sample": str, "lane": str}, keep_default_na=False,
+                       na_values={"reads": [""]})
+
+
+def load_manifest(manifest_path, log_path=None, cache_file=None):
+    '''
+    Load the sample manifest.
+
+    The lanes without reads in the manifest are filled in with the number of sequences
+    analysed reported in the GEAR logs under log_path.
+
+    Parameters
+    ----------
+    manifest_path : str
+        the manifest file (tsv or yaml).
+    log_path : str
+        a directory with GEAR outputs and logs, None does not scan logs.
+    cache_file : str
+        the log scanner cache, see scan_log_totals.
+
+    Returns
+    -------
+    pandas.DataFrame
+        a data frame indexed by sample id (sample + lane) with the sample, lane, category and reads.
+    '''
+    file_exists(manifest_path, True)
+    df = read_manifest_file(manifest_path)
+    df["lane"] = df["lane"].fillna("")
+    df.index = df["sample"] + df["lane"]
+
+    missing = df["reads"].isna()
+    if missing.any() and log_path is not None:
+        totals = scan_log_totals(log_path, cache_file=cache_file)
+        logging.info("Reads of %d lanes taken from the GEAR logs", missing.sum())
+        df.loc[missing, "reads"] = df.index[missing].map(totals)
+    if df["reads"].isna().any():
+        logging.error("Missing reads for %s", ", ".join(df.index[df["reads"].isna()]))
+        exit(errno.EINVAL)
+    df["reads"] = df["reads"].astype("int64")
+    return df
@@ -0,0 +1,99 @@
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+# version of the motif tables, it must be increased when the motifs or their groups change
+MOTIF_TABLE_VERSION = 1
+
+# motif types counted by GEAR, on the G-rich strand
+MOTIF_TYPES = sorted(['ATAGGG', 'CTAGGG', 'GTAGGG', 'TAAGGG', 'TCAGGG', 'TGAGGG', 'TTAAGG', 'TTACGG', 'TTAGAG',
+                      'TTAGCG', 'TTAGGA', 'TTAGGC', 'TTAGGG', 'TTAGGT', 'TTAGTG', 'TTATGG', 'TTCGGG', 'TTGGGG',
+                      'TTTGGG'])
+
+CANONICAL_MOTIFS = ["TTAGGG", "TCAGGG", "TGAGGG", "TTGGGG"]
+
+# regular expressions of the G-run insertions and their C-rich strand equivalents
+REGEX_MOTIFS = dict()
+for x in range(1, 6):
+    REGEX_MOTIFS["TTAGGG(G{%d})[AC]" % x] = "[TG](C{%d})CCCTAA" % x
+    REGEX_MOTIFS["TTAGGG(G{%d})TAGGG" % x] = "CCCTA(C{%d})CCCTAA" % x
+REGEX_MOTIFS["TTAGGG(G{6,})[AC]"] = "[TG](C{6,})CCCTAA"
+REGEX_MOTIFS["TTAGGG(G{6,})TAGGG"] = "CCCTA(C{6,})CCCTAA"
+
+COMPLEMENT = str.maketrans("ACGTacgtN", "TGCAtgcaN")
+
+# the motif codes, and the motif type and group of each code
+MotifTable = namedtuple("MotifTable", ["index", "motif_type", "motif_group"])
+
+
+def reverse_complement(sequence):
+    '''
+    Return the reverse complement of a DNA sequence.
+    '''
+    return sequence.translate(COMPLEMENT)[::-1]
+
+
+def motif_group(motif_type):
+    '''
+    Return the group of a motif type: regex, canonical, Gs or other.
+    '''
+    if "(" in motif_type:
+        return "regex"
+    if motif_type in CANONICAL_MOTIFS:
+        return "canonical"
+    if motif_type[-3:] == "GGG":
+        return "Gs"
+    return "other"
+
+
+def build_motif_table():
+    '''
+    Build the motif table, the motifs of both strands are coded by their position in the index.
+
+    Returns
+    -------
+    MotifTable
+        the motif index (pandas.Index) and the motif type and group arrays. The arrays have
+        an extra missing value at the end, gathered by the code -1 of unknown motifs.
+    '''
+    strand_map = dict()
+    for m in MOTIF_TYPES:
+        strand_map[m] = m
+        strand_map[reverse_complement(m)] = m
+    for m, c_strand in REGEX_MOTIFS.items():
+        strand_map[m] = m
+        strand_map[c_strand] = m
+
+    motif_type = list(strand_map.values())
+    return MotifTable(pd.Index(list(strand_map.keys())),
+                      np.array(motif_type + [np.nan], dtype=object),
+                      np.array([motif_group(m) for m in motif_type] + [np.nan], dtype=object))
+
+
+MOTIF_TABLE = build_motif_table()
+
+
+def motif_codes(motifs):
+    '''
+    Return the integer code of each motif, -1 for the motifs not in the table.
+    '''
+    return MOTIF_TABLE.index.get_indexer(motifs)
+
+
+def map_motifs(motifs):
+    '''
+    Return the motif type and motif group of each motif, missing for the motifs not in the table.
+
+    Parameters
+    ----------
+    motifs : array-like
+        the motifs, of either strand.
+
+    Returns
+    -------
+    tuple
+        the motif types and motif groups (numpy.ndarray).
+    '''
+    codes = motif_codes(motifs)
+    return MOTIF_TABLE.motif_type[codes], MOTIF_TABLE.motif_group[codes]
@@ -0,0 +1,176 @@
+import hashlib
+import logging
+import os
+import tempfile
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from utils import Stage
+
+try:
+    import pyarrow.feather
+    CACHE_EXTENSION = ".feather"
+except ImportError:
+    CACHE_EXTENSION = ".pkl"
+
+# Cache settings: the cache directory, the size cap in bytes (least recently used entries are removed above it)
+# and whether the key uses the file content hash instead of its size and modification time.
+CacheConfig = namedtuple("CacheConfig", ["directory", "max_size", "content_hash"])
+
+INDEX_COLUMN = "__index__"
+
+
+def add_cache_arguments(parser):
+    parser.add_argument('--cache_dir', type=str, help='Directory used to cache the parsed GEAR files (disabled by '
+                                                      'default)', default=None)
+    parser.add_argument('--cache_size', type=int, help='Size cap of the cache in MB', default=1024)
+    parser.add_argument('--cache_hash', action='store_true', help='Use the file content hash as cache key instead '
+                                                                  'of the file size and modification time')
+
+
+def cache_config_from_args(args):
+    if args.cache_dir is None:
+        return None
+    os.makedirs(args.cache_dir, exist_ok=True)
+    return CacheConfig(args.cache_dir, args.cache_size * 1024 * 1024, args.cache_hash)
+
+
+def file_digest(input_path, block_size=1 << 20):
+    '''
+    Return the sha1 hex digest of a file content.
+    '''
+    digest = hashlib.sha1()
+    with open(input_path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def cache_key(input_path, parser_name, version, content_hash=False):
+    '''
+    Return the cache key of a parsed file.
+
+    Parameters
+    ----------
+    input_path : str
+        the parsed file path.
+    parser_name : str
+        the name of the parser function.
+    version : int
+        the parser version, it must be increased when the parser output changes.
+    content_hash : bool
+        if True use the content of the file, otherwise its size and modification time.
+
+    Returns
+    -------
+    str
+        a hex digest identifying the parsed output.
+    '''
+    stat = os.stat(input_path)
+    if content_hash:
+        file_id = file_digest(input_path)
+    else:
+        file_id = "%d:%d" % (stat.st_size, stat.st_mtime_ns)
+    key = "|".join([os.path.abspath(input_path), file_id, parser_name, str(version), CACHE_EXTENSION])
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def _write_frame(df, cache_file):
+    # write to a temporary file first, other processes may be reading the cache
+    fd, tmp_file = tempfile.mkstemp(dir=os.path.dirname(cache_file), suffix=".tmp")
+    os.close(fd)
+    try:
+        if CACHE_EXTENSION == ".feather":
+            # feather requires a default index and string column names
+            df = df.rename_axis(INDEX_COLUMN).reset_index()
+            df.columns = [str(c) for c in df.columns]
+            pyarrow.feather.write_feather(df, tmp_file, compression="lz4")
+        else:
+            df.to_pickle(tmp_file)
+        os.replace(tmp_file, cache_file)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+@Stage("cache read")
+def _read_frame(cache_file):
+    if CACHE_EXTENSION != ".feather":
+        return pd.read_pickle(cache_file)
+    df = pyarrow.feather.read_feather(cache_file)
+    df = df.set_index(INDEX_COLUMN).rename_axis(None)
+    # restore the quality value column names and missing values of text columns
+    df.columns = [int(c) if c.isdigit() else c for c in df.columns]
+    for c in df.columns:
+        if pd.api.types.is_object_dtype(df[c]) or pd.api.types.is_string_dtype(df[c]):
+            df[c] = df[c].where(df[c].notna(), np.nan)
+    return df
+
+
+def evict(directory, max_size):
+    '''
+    Remove the least recently used entries until the cache is below max_size bytes.
+    '''
+    entries = list()
+    for entry in os.scandir(directory):
+        if entry.name.endswith(CACHE_EXTENSION) and entry.is_file():
+            stat = entry.stat()
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(e[1] for e in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+            total -= size
+            logging.debug("Cache entry evicted: %s", path)
+        except OSError:
+            pass
+
+
+def cached_read(config, reader, input_path, version=1, **kwargs):
+    '''
+    Return the output of reader(input_path, **kwargs), using the on-disk cache when possible.
+
+    The key combines the file identity, the reader name and version, so a modified input or
+    a new parser version invalidates the entry. The keyword arguments must not change the
+    parser output (e.g. a chunk size).
+
+    Parameters
+    ----------
+    config : CacheConfig
+        the cache settings, None disables the cache.
+    reader : callable
+        a function that parses input_path into a pandas.DataFrame.
+    input_path : str
+        the file to parse.
+    version : int
+        the parser version.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the parsed file.
+    '''
+    if config is None:
+        return reader(input_path, **kwargs)
+
+    key = cache_key(input_path, reader.__name__, version, config.content_hash)
+    cache_file = os.path.join(config.directory, key + CACHE_EXTENSION)
+    try:
+        df = _read_frame(cache_file)
+        # refresh the entry for the LRU eviction
+        os.utime(cache_file)
+        logging.debug("Cache hit for %s", input_path)
+        return df
+    except FileNotFoundError:
+        pass
+    except Exception as e:
+        logging.warning("Ignoring unreadable cache entry %s: %s", cache_file, e)
+
+    df = reader(input_path, **kwargs)
+    _write_frame(df, cache_file)
+    evict(config.directory, config.max_size)
+    return df
@@ -0,0 +1,174 @@
+from collections import namedtuple
+
+import numpy as np
+
+# offset of the Phred scores in the quality strings (Sanger / Illumina 1.8+)
+PHRED_OFFSET = 33
+
+# bases of the 2 bit codes, the other letters (N) are kept apart, see pack_bases
+BASE_CODES = "ACGT"
+
+_BASE_LOOKUP = np.zeros(256, dtype=np.uint8)
+_IS_BASE = np.zeros(256, dtype=bool)
+for _code, _base in enumerate(BASE_CODES):
+    for _letter in (_base, _base.lower()):
+        _BASE_LOOKUP[ord(_letter)] = _code
+        _IS_BASE[ord(_letter)] = True
+_BASE_LETTERS = np.frombuffer(BASE_CODES.encode("ascii"), dtype=np.uint8)
+
+# A batch of reads: their lengths, the bases (ASCII codes, or PackedBases) and the Phred
+# scores, as (reads, read length) uint8 matrices padded with zeros after the end of each read
+ReadBatch = namedtuple("ReadBatch", ["lengths", "seq", "qv"])
+
+# The 2 bit codes of the bases of a batch, 4 bases per byte, with the flat positions of the N
+PackedBases = namedtuple("PackedBases", ["codes", "lengths", "n_index", "width"])
+
+
+def decode_strings(strings, fill="\0"):
+    '''
+    Decode the ASCII strings of a batch into a uint8 matrix, one row per string.
+
+    The strings are joined in a single buffer that numpy uses without copying it, the
+    shorter strings are padded with fill.
+
+    Parameters
+    ----------
+    strings : list
+        the strings.
+    fill : str
+        the padding character.
+
+    Returns
+    -------
+    tuple
+        the (strings, longest string) uint8 matrix (read-only) and the length of each string.
+    '''
+    lengths = np.fromiter(map(len, strings), dtype=np.int64, count=len(strings))
+    width = int(lengths.max()) if len(strings) > 0 else 0
+    if len(strings) > 0 and lengths.min() < width:
+        strings = [s.ljust(width, fill) for s in strings]
+    buffer = "".join(strings).encode("ascii")
+    return np.frombuffer(buffer, dtype=np.uint8).reshape(len(strings), width), lengths
+
+
+def decode_reads(seq, qv):
+    '''
+    Decode the sequences and quality strings of a batch of reads.
+
+    Parameters
+    ----------
+    seq, qv : list
+        the sequence and the quality string of each read.
+
+    Returns
+    -------
+    ReadBatch
+        the reads, with the Phred scores of the quality strings.
+    '''
+    seq_matrix, lengths = decode_strings(seq)
+    qv_matrix, qv_lengths = decode_strings(qv, chr(PHRED_OFFSET))
+    if not np.array_equal(lengths, qv_lengths):
+        raise ValueError("The sequences and quality strings have different lengths")
+    return ReadBatch(lengths, seq_matrix, qv_matrix - np.uint8(PHRED_OFFSET))
+
+
+def _is_padded(lengths, width):
+    return len(lengths) > 0 and lengths.min() < width
+
+
+def read_mask(lengths, width):
+    '''
+    Return the (reads, width) mask of the positions within each read.
+    '''
+    return np.arange(width) < lengths[:, None]
+
+
+def mean_qv(batch):
+    '''
+    Return the mean Phred score of each read, NaN for the empty reads.
+    '''
+    totals = batch.qv.sum(axis=1, dtype=np.int64)
+    return np.divide(totals, batch.lengths, out=np.full(len(totals), np.nan), where=batch.lengths > 0)
+
+
+def min_qv(batch):
+    '''
+    Return the lowest Phred score of each read, 0 for the empty reads.
+    '''
+    if batch.qv.shape[1] == 0:
+        return np.zeros(len(batch.lengths), dtype=np.uint8)
+    qv = batch.qv
+    if _is_padded(batch.lengths, qv.shape[1]):
+        qv = np.where(read_mask(batch.lengths, qv.shape[1]), qv, np.uint8(255))
+    return np.where(batch.lengths > 0, qv.min(axis=1), 0).astype(np.uint8)
+
+
+def n_count(batch):
+    '''
+    Return the number of N bases of each read.
+    '''
+    return (batch.seq == ord("N")).sum(axis=1)
+
+
+def trimmed_prefix(batch):
+    '''
+    Return the number of trimmed bases at the start of each read, the leading bases with a Phred score of 0.
+    '''
+    kept = batch.qv > 0
+    return np.where(kept.any(axis=1), kept.argmax(axis=1), batch.lengths)
+
+
+def pack_bases(seq, lengths):
+    '''
+    Pack the bases of a batch in 2 bits, a quarter of the memory of their ASCII codes.
+
+    The letters other than A, C, G and T have no code, they are stored by their flat position
+    in the matrix and restored as N; they are few in sequenced reads.
+
+    Parameters
+    ----------
+    seq : numpy.ndarray
+        the (reads, width) ASCII codes of the bases, see decode_reads.
+    lengths : numpy.ndarray
+        the length of each read.
+
+    Returns
+    -------
+    PackedBases
+        the packed bases.
+    '''
+    rows, width = seq.shape
+    codes = _BASE_LOOKUP[seq]
+    other = ~_IS_BASE[seq]
+    if _is_padded(lengths, width):
+        other &= read_mask(lengths, width)
+    n_index = np.flatnonzero(other)
+
+    padding = -width % 4
+    if padding > 0:
+        codes = np.pad(codes, ((0, 0), (0, padding)))
+    codes = codes.reshape(rows, codes.shape[1] // 4, 4)
+    packed = codes[:, :, 0] << 6 | codes[:, :, 1] << 4 | codes[:, :, 2] << 2 | codes[:, :, 3]
+    return PackedBases(packed, lengths, n_index, width)
+
+
+def unpack_bases(packed):
+    '''
+    Restore the (reads, width) ASCII codes of bases packed with pack_bases.
+    '''
+    codes = packed.codes
+    codes = np.stack([codes >> 6, (codes >> 4) & 3, (codes >> 2) & 3, codes & 3], axis=2)
+    seq = _BASE_LETTERS[codes.reshape(len(codes), codes.shape[1] * 4)[:, :packed.width]]
+    seq.flat[packed.n_index] = ord("N")
+    if _is_padded(packed.lengths, packed.width):
+        seq[~read_mask(packed.lengths, packed.width)] = 0
+    return seq
+
+
+def batch_nbytes(batch):
+    '''
+    Return the memory used by the matrices of a batch in bytes.
+    '''
+    seq = batch.seq
+    seq_bytes = seq.codes.nbytes + seq.n_index.nbytes if isinstance(seq, PackedBases) else seq.nbytes
+    return batch.lengths.nbytes + seq_bytes + batch.qv.nbytes
@@ -0,0 +1,318 @@
+import gzip
+import json
+import os
+
+import numpy as np
+
+from motifs import MOTIF_TABLE, MOTIF_TYPES
+
+# chromosome names of the reference, the synthetic cohorts with more chromosomes add unplaced contigs
+CHROMOSOMES = ["chr%d" % i for i in range(1, 23)] + ["chrX", "chrY"]
+
+# regions of GEAR's outputs that are not attached to a chromosome
+SPECIAL_REGIONS = [("mapq_fail", "mapq_fail_"), ("other", "other_"), ("qv_fail", "qv_fail_"),
+                   ("unmapped", "unmapped_")]
+
+# quality values reported by binned Illumina base calls
+QUALITY_BINS = [2, 11, 25, 37]
+
+READ_LENGTH = 150
+
+# changes of the palindromic doublets, a change and its reverse complement are the same DBS
+PALINDROMIC_DBS = {"AT": ["CA", "CC", "CG", "GA", "GC", "TA"], "CG": ["AT", "GC", "GT", "TA", "TC", "TT"],
+                   "GC": ["AA", "AG", "AT", "CA", "CG", "TA"], "TA": ["AT", "CG", "CT", "GC", "GG", "GT"]}
+
+TELOMERE_REPEAT = "TTAGGG"
+
+LOG_TEMPLATE = "Info    [2020-10-20 11:30:34] | Total sequences analysed: %d\n" \
+               "Info    [2020-10-20 11:30:35] | All done! \n"
+
+
+def chromosome_names(chromosomes):
+    return CHROMOSOMES[:chromosomes] + ["chrUn_%d" % i for i in range(chromosomes - len(CHROMOSOMES))]
+
+
+def chromosome_regions(chromosomes, regions, interstitial_name):
+    '''
+    Return the regions of each chromosome, (name, start, end): the two telomeres and the interstitial regions.
+    '''
+    names = ["p_telomere", "q_telomere"] + [interstitial_name] * max(regions - 2, 0)
+    layout = dict()
+    for i, chromosome in enumerate(chromosome_names(chromosomes)):
+        length = 50000000 + 5000000 * i
+        items = list()
+        for j, name in enumerate(names[:regions]):
+            if name == "p_telomere":
+                items.append((name, 9995, 11005))
+            elif name == "q_telomere":
+                items.append((name, length - 1010, length))
+            else:
+                step = (length - 22010) // (regions - 2)
+                items.append((name, 11006 + (j - 2) * step, 11006 + (j - 1) * step - 1))
+        layout[chromosome] = items
+    return layout
+
+
+def gear_motifs(motifs):
+    '''
+    Return the motifs (up to the given number) and the regular expressions counted by GEAR MotifCount.
+    '''
+    all_motifs = [m for m in MOTIF_TABLE.index if "(" not in m]
+    regex = [m for m in MOTIF_TABLE.index if "(" in m]
+    return sorted(all_motifs)[:motifs], sorted(regex)
+
+
+def motif_histogram(rng, reads):
+    '''
+    Return a GEAR quality value histogram: most motifs are not found, the others in a few quality bins.
+    '''
+    histogram = dict((str(q), 0) for q in range(100))
+    if rng.random_sample() < 0.3:
+        scale = max(reads / 100000.0, 0.01)
+        for q in rng.choice(QUALITY_BINS, size=rng.randint(1, len(QUALITY_BINS) + 1), replace=False):
+            histogram[str(q)] = int(rng.geometric(1.0 / (1 + 50 * scale)))
+    return histogram
+
+
+def motif_count_data(rng, chromosomes=24, regions=3, motifs=38, reads=50000):
+    '''
+    Return the content of a synthetic GEAR MotifCount output.
+
+    Parameters
+    ----------
+    rng : numpy.random.RandomState
+        the random generator.
+    chromosomes : int
+        number of chromosomes.
+    regions : int
+        number of regions of each chromosome (the two telomeres and the interstitial regions).
+    motifs : int
+        number of motifs, the regular expressions are always counted.
+    reads : int
+        number of reads of the sample, it scales the counts.
+
+    Returns
+    -------
+    dict
+        the json document.
+    '''
+    motif_list, regex_list = gear_motifs(motifs)
+    regions_layout = chromosome_regions(chromosomes, regions, "c_interstitial")
+    regions_layout.update({c: [(name, 0, 0)] for c, name in SPECIAL_REGIONS})
+
+    data = dict()
+    for chromosome in sorted(regions_layout):
+        items = list()
+        for name, start, end in regions_layout[chromosome]:
+            count = int(rng.poisson(reads / 1000.0))
+            items.append({"start": start, "end": end, "name": name, "count": count,
+                          "total_bases": count * READ_LENGTH,
+                          "motifs": {m: motif_histogram(rng, reads) for m in motif_list},
+                          "regex": {m: motif_histogram(rng, reads) for m in regex_list}})
+        data[chromosome] = items
+    return data
+
+
+def mutation_ids():
+    '''
+    Return the GEAR VariantCallAnalysis mutation ids: 96 SBS with context, 78 DBS and 83 indels.
+    '''
+    bases = "ACGT"
+    ids = list()
+    for ref in "CT":
+        for alt in bases:
+            if alt != ref:
+                ids += ["%s>%s_%s%s%s" % (ref, alt, left, ref, right) for left in bases for right in bases]
+    for ref in ["AC", "AT", "CC", "CG", "CT", "GC", "TA", "TC", "TG", "TT"]:
+        alts = PALINDROMIC_DBS.get(ref, [a + b for a in bases if a != ref[0] for b in bases if b != ref[1]])
+        ids += ["%s>%s" % (ref, alt) for alt in alts]
+    lengths = ["0", "1", "2", "3", "4", "5+"]
+    for kind in ["DEL", "INS"]:
+        ids += ["%s_%s_1_%s" % (kind, base, n) for base in "CT" for n in lengths]
+        ids += ["%s_repeats_%s_%s" % (kind, size, n) for size in ["2", "3", "4", "5+"] for n in lengths]
+    ids += ["DEL_MH_%s_%s" % (size, n) for size, n in [("2", "1"), ("3", "1"), ("3", "2"), ("4", "1"), ("4", "2"),
+                                                       ("4", "3"), ("5+", "1"), ("5+", "2"), ("5+", "3"),
+                                                       ("5+", "4"), ("5+", "5+")]]
+    return ids
+
+
+def vca_data(rng, samples, chromosomes=24, regions=3, density=0.02):
+    '''
+    Return the content of a synthetic GEAR VariantCallAnalysis output.
+
+    Parameters
+    ----------
+    rng : numpy.random.RandomState
+        the random generator.
+    samples : list
+        the sample ids with counts in the file.
+    chromosomes : int
+        number of chromosomes.
+    regions : int
+        number of regions of each chromosome.
+    density : float
+        fraction of non zero counts.
+
+    Returns
+    -------
+    dict
+        the json document.
+    '''
+    keys = ["%s:%s" % (m, status) for m in mutation_ids() for status in ["FAIL", "NP", "PASS"]]
+    regions_layout = chromosome_regions(chromosomes, regions, "inner_non_telomeric")
+    regions_layout.update({c: [(name, 0, 0)] for c, name in SPECIAL_REGIONS})
+
+    data = dict()
+    for chromosome in sorted(regions_layout):
+        items = list()
+        for name, start, end in regions_layout[chromosome]:
+            counts = rng.geometric(0.3, size=(len(keys), len(samples))) * (
+                    rng.random_sample((len(keys), len(samples))) < density)
+            items.append({"start": start, "end": end, "name": name, "total_bases": 0,
+                          "mutations": {k: dict(zip(samples, map(int, c))) for k, c in zip(keys, counts)}})
+        data[chromosome] = items
+    return data
+
+
+def telomere_read(rng, name, error_rate=0.01):
+    '''
+    Return a synthetic GEAR TelomereMutation read: a telomeric repeat read with substitutions and
+    indels, whose cs string, SBS and indel events are consistent.
+    '''
+    qs = int(rng.randint(0, 30))
+    aligned = READ_LENGTH - qs
+    offset = int(rng.randint(0, len(TELOMERE_REPEAT)))
+    reference = (TELOMERE_REPEAT * (READ_LENGTH // len(TELOMERE_REPEAT) + 3))[offset:]
+    qualities = ",:F"
+
+    query, cs, sbs, indels = list(), list(), dict(), dict()
+    ref_index, match = 0, 0
+    while len(query) < aligned:
+        event = rng.random_sample()
+        ref_base = reference[ref_index]
+        position = qs + len(query)
+        if event < error_rate:
+            alt = str(rng.choice([b for b in "ACGT" if b != ref_base]))
+            cs.append(":%d" % match if match > 0 else "")
+            cs.append("*%s%s" % (ref_base.lower(), alt.lower()))
+            sbs[str(position)] = [{"pos": (offset + ref_index) % len(TELOMERE_REPEAT), "qv": int(rng.choice(
+                QUALITY_BINS)), "mean_qv": round(float(rng.uniform(10, 37)), 1), "is_trimmed": int(
+                rng.random_sample() < 0.5), "value": alt}]
+            query.append(alt)
+            match = 0
+        elif event < error_rate * 1.1:
+            cs.append(":%d" % match if match > 0 else "")
+            cs.append("-%s" % ref_base.lower())
+            indels[str(position)] = [{"pos": (offset + ref_index) % len(TELOMERE_REPEAT), "mean_qv": int(
+                rng.choice(QUALITY_BINS)), "is_trimmed": 0, "seq": ref_base.lower(), "kind": "del"}]
+            match = 0
+        elif event < error_rate * 1.2:
+            ins = str(rng.choice(list("ACGT")))
+            cs.append(":%d" % match if match > 0 else "")
+            cs.append("+%s" % ins.lower())
+            indels[str(position)] = [{"pos": (offset + ref_index) % len(TELOMERE_REPEAT), "mean_qv": int(
+                rng.choice(QUALITY_BINS)), "is_trimmed": 0, "seq": ins.lower(), "kind": "ins"}]
+            query.append(ins)
+            match = 0
+            continue
+        else:
+            query.append(ref_base)
+            match += 1
+        ref_index += 1
+    if match > 0:
+        cs.append(":%d" % match)
+
+    seq = "".join(rng.choice(list("ACGT"), size=qs)) + "".join(query)
+    qv = "".join(rng.choice(list(qualities), size=READ_LENGTH))
+    ts = qs + int(rng.randint(0, 10))
+    deletions = sum(1 for v in indels.values() if v[0]["kind"] == "del")
+    insertions = len(indels) - deletions
+    read = {"rs": 10000 + offset, "re": 10000 + offset + ref_index, "qs": qs, "qe": READ_LENGTH, "ts": ts,
+            "te": READ_LENGTH, "seq_len": READ_LENGTH, "mapq": int(rng.choice([0, 60])), "mlen": aligned - len(sbs),
+            "blen": ref_index, "tlen": 0, "score": round(float(rng.uniform(0.3, 1)), 6),
+            "reverse": int(rng.random_sample() < 0.5)}
+    for m in MOTIF_TYPES:
+        count = seq.count(m)
+        if count > 0:
+            read[m] = count
+    read.update({"mean_ins_size": 1 if insertions else 0, "mean_ins_qv": 0, "ins_count": insertions,
+                 "mean_del_size": 1 if deletions else 0, "mean_del_qv": 0, "del_count": deletions,
+                 "sbs": sbs, "indels": indels, "seq": seq, "qv": qv,
+                 "seq_trimmed": "N" * ts + seq[ts:], "qv_trimmed": "!" * ts + qv[ts:],
+                 "cs_str": "".join(cs), "comment": "", "name": name})
+    return read
+
+
+def telomere_mutation_data(rng, reads=20000, error_rate=0.01):
+    '''
+    Return the content of a synthetic GEAR TelomereMutation output, about half of the reads are
+    mate pairs sharing their name.
+    '''
+    data = list()
+    while len(data) < reads:
+        name = "SYN:1:FLOWCELL:1:%d:%d:%d" % (rng.randint(1000, 3000), rng.randint(1000, 30000), len(data))
+        data.append(telomere_read(rng, name, error_rate))
+        if rng.random_sample() < 0.5 and len(data) < reads:
+            data.append(telomere_read(rng, name, error_rate))
+    return data
+
+
+def write_gear_output(directory, data, total_reads):
+    '''
+    Write a GEAR output directory: the compressed json document and the log with the number of reads.
+    '''
+    os.makedirs(directory, exist_ok=True)
+    with gzip.open(os.path.join(directory, "output.json.gz"), "wt", compresslevel=6) as f:
+        json.dump(data, f, separators=(",", ":"))
+    with open(os.path.join(directory, "output.log"), "w") as f:
+        f.write(LOG_TEMPLATE % total_reads)
+
+
+def generate_cohort(directory, samples=4, lanes=2, chromosomes=24, regions=3, motifs=38, reads=20000,
+                    total_reads=50000000, seed=0):
+    '''
+    Write a synthetic cohort with GEAR's directory layout and a sample manifest.
+
+    Parameters
+    ----------
+    directory : str
+        the output directory, it gets GEAR_MOTIF_COUNT, GEAR_VCA, GEAR_TELOMERE_MUTATION and manifest.tsv.
+    samples : int
+        number of samples, half of them controls.
+    lanes : int
+        number of lanes of each sample.
+    chromosomes, regions, motifs : int
+        the size of the MotifCount and VariantCallAnalysis outputs, see motif_count_data.
+    reads : int
+        number of reads of each TelomereMutation output.
+    total_reads : int
+        number of sequences of each lane.
+    seed : int
+        the random seed.
+
+    Returns
+    -------
+    list
+        the sample ids (sample + lane).
+    '''
+    rng = np.random.RandomState(seed)
+    rows = list()
+    for i in range(samples):
+        sample = "S%d" % (i + 1)
+        category = "Con" if i < (samples + 1) // 2 else "MSH6 KO"
+        for j in range(lanes):
+            lane = "L%d" % (j + 1)
+            lane_reads = int(total_reads * rng.uniform(0.8, 1.2))
+            write_gear_output(os.path.join(directory, "GEAR_MOTIF_COUNT", sample, lane),
+                              motif_count_data(rng, chromosomes, regions, motifs, lane_reads), lane_reads)
+            write_gear_output(os.path.join(directory, "GEAR_VCA", sample + lane),
+                              vca_data(rng, [sample + lane], chromosomes, regions), lane_reads)
+            write_gear_output(os.path.join(directory, "GEAR_TELOMERE_MUTATION", sample, lane),
+                              telomere_mutation_data(rng, reads), lane_reads)
+            rows.append((sample, lane, category, lane_reads))
+
+    with open(os.path.join(directory, "manifest.tsv"), "w") as f:
+        f.write("sample\tlane\tcategory\treads\n")
+        for row in rows:
+            f.write("%s\t%s\t%s\t%d\n" % row)
+    return [sample + lane for sample, lane, _, _ in rows]
@@ -0,0 +1,288 @@
+import logging
+import os
+
+import pandas as pd
+
+try:
+    import pyarrow
+    import pyarrow.feather
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:
+    pass
+
+from utils import Stage, file_exists
+
+# formats of the intermediate tables, the columnar formats require pyarrow
+TABLE_FORMATS = {"csv": ".csv", "parquet": ".parquet", "feather": ".feather"}
+
+# label columns stored as categorical in the columnar formats
+CATEGORICAL_COLUMNS = ["sample_id", "category", "motif_type", "motif_group", "region", "chromosome", "name", "motif",
+                       "metric", "group", "signature", "Type", "SubType", "left", "right", "mutation_id"]
+
+INDEX_COLUMN = "__index__"
+
+# format read first when a table is saved in several formats, see set_table_format
+_table_format = "csv"
+
+# tables loaded with load_tables, shared by the readers of the process (and of the processes forked from it)
+_loaded_tables = dict()
+
+
+def add_format_argument(parser):
+    parser.add_argument('-f', '--format', type=str, choices=list(TABLE_FORMATS), default="csv",
+                        help='Format of the output tables')
+
+
+def table_file(path, table_format):
+    return path + TABLE_FORMATS[table_format]
+
+
+def set_table_format(table_format):
+    '''
+    Set the format read first when a table is saved in several formats, e.g. the format of the
+    tables written by the analysis scripts.
+    '''
+    global _table_format
+    _table_format = table_format
+
+
+def table_files(path, table_format=None):
+    '''
+    Return the files of a table that exist, in the order of preference: the requested format,
+    then the other formats in the order of TABLE_FORMATS.
+
+    Parameters
+    ----------
+    path : str
+        the table path without extension.
+    table_format : str
+        the preferred format, None uses the format set with set_table_format.
+
+    Returns
+    -------
+    list
+        the file paths.
+    '''
+    preferred = _table_format if table_format is None else table_format
+    order = [preferred] + [f for f in TABLE_FORMATS if f != preferred]
+    return [table_file(path, f) for f in order if os.path.exists(table_file(path, f))]
+
+
+def find_table(path, table_format=None):
+    '''
+    Return the file of a table, in the preferred format if it exists, see table_files.
+
+    The modification times are not used: a copy of the table left in another format by an
+    earlier run is never read instead of the preferred one.
+
+    Parameters
+    ----------
+    path : str
+        the table path without extension.
+    table_format : str
+        the preferred format, None uses the format set with set_table_format.
+
+    Returns
+    -------
+    str
+        the file path.
+    '''
+    candidates = table_files(path, table_format)
+    if len(candidates) == 0:
+        file_exists(table_file(path, _table_format if table_format is None else table_format), True)
+    if len(candidates) > 1:
+        logging.debug("Table %s is saved in several formats, reading %s", path, candidates[0])
+    return candidates[0]
+
+
+def write_table(df, path, table_format="csv"):
+    '''
+    Save an intermediate table.
+
+    Parameters
+    ----------
+    df : pandas.DataFrame
+        the table.
+    path : str
+        the table path without extension.
+    table_format : str
+        csv, parquet or feather.
+
+    Returns
+    -------
+    str
+        the saved file path.
+    '''
+    output_file = table_file(path, table_format)
+    with Stage("table write", len(df)):
+        if table_format == "csv":
+            df.to_csv(output_file)
+            return output_file
+
+        # the columnar formats require string column names, the labels are stored as categorical
+        df = df.copy()
+        df.columns = [str(c) for c in df.columns]
+        for c in CATEGORICAL_COLUMNS:
+            if c in df.columns and (pd.api.types.is_object_dtype(df[c]) or pd.api.types.is_string_dtype(df[c])):
+                df[c] = df[c].astype("category")
+        if table_format == "parquet":
+            df.to_parquet(output_file, compression="snappy")
+        else:
+            # feather requires a default index, the index levels are stored as columns
+            df.index.names = [INDEX_COLUMN + str(i) for i in range(df.index.nlevels)]
+            df.reset_index().to_feather(output_file, compression="lz4")
+    return output_file
+
+
+class TableWriter:
+    '''
+    Write an intermediate table in parts, appending each data frame to the file.
+
+    The parts must have the same columns, the first one sets the columns (and the column types
+    of the columnar formats). The file is readable with read_table once the writer is closed.
+
+    Parameters
+    ----------
+    path : str
+        the table path without extension.
+    table_format : str
+        csv, parquet or feather.
+    '''
+
+    def __init__(self, path, table_format="csv"):
+        self.output_file = table_file(path, table_format)
+        self.table_format = table_format
+        self.columns = None
+        self.schema = None
+        self.writer = None
+        self.rows = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def _arrow_table(self, df):
+        # same layout as write_table: string column names and the index levels as columns
+        df = df.copy()
+        df.columns = [str(c) for c in df.columns]
+        df.index.names = [INDEX_COLUMN + str(i) for i in range(df.index.nlevels)]
+        df = df.reset_index()
+        if self.table_format == "feather":
+            # the IPC file format allows a single dictionary per column, the categories of the parts differ
+            for c in df.columns[df.dtypes == "category"]:
+                df[c] = df[c].astype(df[c].cat.categories.dtype)
+        if self.schema is None:
+            table = pyarrow.Table.from_pandas(df, preserve_index=False)
+            # columns without values in the first part are typed as text and the categorical
+            # columns use wide dictionary indices, the following parts may have more categories
+            fields = list()
+            for f in table.schema:
+                if pyarrow.types.is_null(f.type):
+                    f = f.with_type(pyarrow.string())
+                elif pyarrow.types.is_dictionary(f.type):
+                    f = f.with_type(pyarrow.dictionary(pyarrow.int32(), f.type.value_type))
+                fields.append(f)
+            self.schema = pyarrow.schema(fields, metadata=table.schema.metadata)
+        return pyarrow.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+
+    def write(self, df):
+        '''
+        Append a data frame to the table.
+        '''
+        if self.columns is None:
+            self.columns = list(df.columns)
+        else:
+            df = df[self.columns]
+
+        with Stage("table write", len(df)):
+            if self.table_format == "csv":
+                df.to_csv(self.output_file, mode="w" if self.rows == 0 else "a", header=self.rows == 0)
+            else:
+                table = self._arrow_table(df)
+                if self.writer is None and self.table_format == "parquet":
+                    self.writer = pyarrow.parquet.ParquetWriter(self.output_file, self.schema,
+                                                                compression="snappy")
+                elif self.writer is None:
+                    self.writer = pyarrow.ipc.new_file(self.output_file, self.schema,
+                                                       options=pyarrow.ipc.IpcWriteOptions(compression="lz4"))
+                self.writer.write_table(table)
+        self.rows += len(df)
+
+    def close(self):
+        if self.writer is not None:
+            self.writer.close()
+            self.writer = None
+
+
+@Stage("table read")
+def read_table(path, columns=None, categorical=False):
+    '''
+    Load an intermediate table saved with write_table.
+
+    Parameters
+    ----------
+    path : str
+        the table path without extension, read in the preferred format if it exists (see find_table).
+    columns : list
+        the columns to load (the index is always loaded), None loads all of them.
+    categorical : bool
+        if True the label columns are returned as categorical, otherwise as plain strings.
+
+    Returns
+    -------
+    pandas.DataFrame
+        the table.
+    '''
+    df = _loaded_tables.get(path)
+    if df is not None and not categorical and (columns is None or set(columns) <= set(df.columns)):
+        # a shallow copy, the shared table must not be modified in place
+        return (df if columns is None else df[list(columns)]).copy(deep=False)
+
+    input_file = find_table(path)
+    logging.debug("Reading table %s", input_file)
+    if input_file.endswith(".csv"):
+        header = pd.read_csv(input_file, index_col=0, nrows=0).columns
+        usecols = None if columns is None else [0] + [i + 1 for i, c in enumerate(header) if c in columns]
+        dtype = {c: "category" for c in CATEGORICAL_COLUMNS
+                 if c in header and (columns is None or c in columns)} if categorical else None
+        df = pd.read_csv(input_file, index_col=0, usecols=usecols, dtype=dtype)
+    else:
+        # the tables written in parts store the index levels as columns
+        if input_file.endswith(".parquet"):
+            header = pyarrow.parquet.read_schema(input_file).names
+        else:
+            # the schema only, the columns are decompressed when they are read
+            with pyarrow.ipc.open_file(input_file) as reader:
+                header = reader.schema.names
+        index_columns = [c for c in header if c.startswith(INDEX_COLUMN)]
+        if columns is not None:
+            columns = index_columns + list(columns)
+        if input_file.endswith(".parquet"):
+            df = pd.read_parquet(input_file, columns=columns)
+        else:
+            df = pd.read_feather(input_file, columns=columns)
+        if len(index_columns) > 0:
+            df = df.set_index(index_columns)
+            df.index.names = [None] * len(index_columns)
+
+    if not categorical:
+        for c in df.columns[df.dtypes == "category"]:
+            df[c] = df[c].astype(df[c].cat.categories.dtype)
+    return df
+
+
+def load_tables(tables):
+    '''
+    Load tables once, the following read_table calls of the process are served from memory.
+
+    Parameters
+    ----------
+    tables : dict
+        pairs {path: columns}, columns is None to load all of them.
+    '''
+    for path, columns in tables.items():
+        _loaded_tables[path] = read_table(path, columns)
+        logging.info("Loaded table %s: %d rows", path, len(_loaded_tables[path]))
@@ -1,6 +1,23 @@
+import ast
 import logging
+import multiprocessing
 import os
 import errno
+import json
+import fnmatch
+import functools
+import re
+import sys
+import threading
+import time
+from collections import deque, namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows, the peak RSS is not reported
+    resource = None
 
 
 def file_exists(data_file, must_exist=False):
@@ -96,17 +113,400 @@ def print_cmri_welcome(name):
     logging.info("")
 
 
-def find_files(input_path, ext, compressed=False, path_list=None ):
-    if path_list is None:
-        path_list = list()
-    file_name_list=os.path.basename(input_path).split(".")
-    if os.path.isdir(input_path):
-        for p in os.listdir(input_path):
-            find_files(os.path.join(input_path, p), ext, compressed, path_list)
-    elif compressed and len(file_name_list) ==3:
-        if ".".join(file_name_list[1:]) == ext:
-            path_list.append(input_path)
-    elif file_name_list[-1] == ext:
-        path_list.append(input_path)
-
-    return path_list
+# stages recorded by the process, as trace events (see Stage)
+_stage_events = list()
+_stage_depth = threading.local()
+
+
+def peak_rss_mb():
+    '''
+    Return the peak resident memory of the process in MB, None if it is not available.
+    '''
+    if resource is None:
+        return None
+    # ru_maxrss is in kilobytes on Linux and in bytes on macOS
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / 1e6 if sys.platform == "darwin" else rss / 1e3
+
+
+class Stage(object):
+    '''
+    Record the wall time, CPU time, peak RSS and number of rows of a stage of the analysis.
+
+    Use it as a context manager, setting the rows processed if they are known:
+
+        with Stage("group-by") as stage:
+            df = df.groupby(...).sum()
+            stage.rows = len(df)
+
+    or as a function decorator, the rows are then the length of the returned table or list.
+    Each stage is logged at debug level and recorded as a trace event, see report_stages.
+
+    Parameters
+    ----------
+    name : str
+        the stage name, e.g. json decode. The stages with the same name are summed in the report.
+    rows : int
+        the number of rows processed, if known beforehand.
+    '''
+
+    def __init__(self, name, rows=None):
+        self.name = name
+        self.rows = rows
+
+    def __enter__(self):
+        self.depth = getattr(_stage_depth, "value", 0)
+        _stage_depth.value = self.depth + 1
+        self.start = time.time()
+        self.start_wall = time.perf_counter()
+        self.start_cpu = time.process_time()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        wall = time.perf_counter() - self.start_wall
+        cpu = time.process_time() - self.start_cpu
+        _stage_depth.value = self.depth
+        rss = peak_rss_mb()
+        args = {"cpu_s": cpu, "peak_rss_mb": rss}
+        if self.rows is not None:
+            args["rows"] = int(self.rows)
+        # trace event format, a complete event with its start and duration in microseconds
+        _stage_events.append({"name": self.name, "ph": "X", "ts": int(self.start * 1e6), "dur": int(wall * 1e6),
+                              "pid": os.getpid(), "tid": threading.get_ident(), "args": args})
+        logging.debug("%sStage %s: wall %.3f s, cpu %.3f s, peak RSS %s MB%s", "  " * self.depth, self.name, wall,
+                      cpu, "-" if rss is None else "%.1f" % rss,
+                      "" if self.rows is None else ", %d rows" % self.rows)
+        return False
+
+    def __call__(self, func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with Stage(self.name, self.rows) as stage:
+                result = func(*args, **kwargs)
+                if stage.rows is None and isinstance(result, list):
+                    stage.rows = len(result)
+                elif stage.rows is None and hasattr(result, "shape"):
+                    stage.rows = result.shape[0]
+            return result
+        return wrapper
+
+
+def _call_with_stages(func, path):
+    '''
+    Call a function in a worker process, returning the stages it recorded with its result.
+    '''
+    # a forked process starts with a copy of the stages of its parent
+    del _stage_events[:]
+    return func(path), list(_stage_events)
+
+
+def _collect_stages(value):
+    result, events = value
+    _stage_events.extend(events)
+    return result
+
+
+def add_trace_argument(parser):
+    parser.add_argument('--trace', type=str, help='Save the stage timings to a trace event json file (e.g. for '
+                                                  'chrome://tracing, Perfetto or speedscope)', default=None)
+
+
+def report_stages(trace_file=None):
+    '''
+    Log the total wall and CPU time of each stage and optionally save the stages as trace events.
+
+    Parameters
+    ----------
+    trace_file : str
+        the trace event json file, None does not save it.
+    '''
+    totals = dict()
+    for event in _stage_events:
+        total = totals.setdefault(event["name"], [0, 0.0, 0.0, None])
+        total[0] += 1
+        total[1] += event["dur"] / 1e6
+        total[2] += event["args"]["cpu_s"]
+        if "rows" in event["args"]:
+            total[3] = (total[3] or 0) + event["args"]["rows"]
+    for name, (calls, wall, cpu, rows) in totals.items():
+        logging.info("Stage %-16s %4d calls, wall %8.3f s, cpu %8.3f s%s", name, calls, wall, cpu,
+                     "" if rows is None else ", %d rows" % rows)
+    rss = peak_rss_mb()
+    if rss is not None:
+        logging.info("Peak RSS: %.1f MB", rss)
+
+    if trace_file is not None:
+        with open(trace_file, "w") as f:
+            json.dump({"traceEvents": _stage_events, "displayTimeUnit": "ms"}, f)
+        logging.info("Trace saved: %s", trace_file)
+
+
+# lane directory names, e.g. L1 or A3L1
+LANE_PATTERN = re.compile(r"^(.*?)(L\d+)$")
+
+
+def is_hidden(name):
+    '''
+    Return True for hidden files and directories, including the AppleDouble ._ files.
+    '''
+    return name.startswith(".")
+
+
+def scan_files(input_path, match):
+    '''
+    Iterate the files under a directory, skipping hidden files and directories.
+
+    The tree is traversed iteratively with os.scandir, reusing the directory entry type
+    instead of a stat call per entry.
+
+    Parameters
+    ----------
+    input_path : str
+        a directory (or a single file).
+    match : callable
+        a function that takes a file name and returns True for the files to keep.
+
+    Returns
+    -------
+    generator
+        os.DirEntry objects of the matching files, in sorted path order.
+    '''
+    if not os.path.isdir(input_path):
+        # a single file, scan its directory for it
+        name = os.path.basename(input_path)
+        with os.scandir(os.path.dirname(input_path) or ".") as it:
+            for entry in it:
+                if entry.name == name and match(name):
+                    yield entry
+        return
+
+    stack = [input_path]
+    while stack:
+        with os.scandir(stack.pop()) as it:
+            entries = sorted((e for e in it if not is_hidden(e.name)), key=lambda e: e.name)
+        directories = list()
+        for entry in entries:
+            if entry.is_dir():
+                directories.append(entry.path)
+            elif match(entry.name):
+                yield entry
+        stack.extend(reversed(directories))
+
+
+class GearFile(namedtuple("GearFile", ["sample", "lane", "path", "size"])):
+    '''
+    A GEAR output file, the sample and lane are taken from the directory layout, either
+    <sample>/<lane>/<file> (e.g. A1/L1) or <sample><lane>/<file> (e.g. A3L1).
+    '''
+    __slots__ = ()
+
+    @property
+    def sample_id(self):
+        return self.sample + self.lane
+
+
+@Stage("discovery")
+def find_gear_files(input_path, patterns=("*.json.gz",)):
+    '''
+    Find the GEAR output files under a directory.
+
+    Parameters
+    ----------
+    input_path : str
+        the GEAR output directory.
+    patterns : list
+        glob patterns of the file names, e.g. *.json.gz or *.log.
+
+    Returns
+    -------
+    list
+        a list of GearFile records, in sorted path order.
+    '''
+    records = list()
+    for entry in scan_files(input_path, lambda name: any(fnmatch.fnmatchcase(name, p) for p in patterns)):
+        directories = os.path.dirname(entry.path).split(os.sep)
+        match = LANE_PATTERN.match(directories[-1])
+        if match is not None and match.group(1):
+            sample, lane = match.group(1), match.group(2)
+        elif match is not None and len(directories) > 1:
+            sample, lane = directories[-2], directories[-1]
+        else:
+            sample, lane = directories[-1], ""
+        records.append(GearFile(sample, lane, entry.path, entry.stat().st_size))
+    return records
+
+
+def find_files(input_path, ext, compressed=False):
+    '''
+    Return the paths of the files with a given extension under a directory, skipping hidden files.
+
+    Parameters
+    ----------
+    input_path : str
+        a directory (or a single file).
+    ext : str
+        the extension, e.g. log or json.gz.
+    compressed : bool
+        if True, ext is the compound extension of the file name (e.g. output.json.gz).
+
+    Returns
+    -------
+    list
+        the file paths, in sorted order.
+    '''
+    def match(name):
+        file_name_list = name.split(".")
+        if compressed and len(file_name_list) == 3:
+            return ".".join(file_name_list[1:]) == ext
+        return file_name_list[-1] == ext
+
+    return [entry.path for entry in scan_files(input_path, match)]
+
+
+def local_modules(script, found=None):
+    '''
+    Return the script and the modules of this directory it imports, recursively.
+    '''
+    found = set() if found is None else found
+    found.add(script)
+    with open(script) as f:
+        tree = ast.parse(f.read(), script)
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Import):
+            names = [a.name for a in node.names]
+        elif isinstance(node, ast.ImportFrom) and node.module is not None:
+            names = [node.module]
+        else:
+            continue
+        for name in names:
+            module_file = os.path.join(os.path.dirname(script), name.split(".")[0] + ".py")
+            if module_file not in found and os.path.exists(module_file):
+                local_modules(module_file, found)
+    return found
+
+
+def fork_context():
+    '''
+    Return the multiprocessing context of the fork start method, None where the platform does not
+    support it (Windows).
+    '''
+    if "fork" in multiprocessing.get_all_start_methods():
+        return multiprocessing.get_context("fork")
+    return None
+
+
+def imap_files(func, file_list, jobs=1, setup=None, setup_args=()):
+    '''
+    Iterate the results of a function applied to each file, optionally spreading the files
+    across a pool of processes.
+
+    At most two files per process are in flight, so the results are consumed as they are
+    produced instead of being held in memory.
+
+    Parameters
+    ----------
+    func : callable
+        a picklable function (defined at module level) that takes a file path.
+    file_list : list
+        the file paths.
+    jobs : int
+        number of processes, 1 runs in the current process and 0 uses all the cores.
+    setup : callable
+        a picklable function that prepares the state shared by the calls (e.g. loads tables). It
+        runs once in the current process and the workers are forked from it, so they share its
+        memory; where fork is not available it runs once in each worker instead.
+    setup_args : tuple
+        the arguments of setup.
+
+    Returns
+    -------
+    generator
+        the results, in the same order as file_list.
+    '''
+    if jobs == 0:
+        jobs = os.cpu_count()
+    jobs = min(jobs, len(file_list))
+    context = None if setup is None else fork_context()
+    if setup is not None and (jobs <= 1 or context is not None):
+        setup(*setup_args)
+    if jobs <= 1:
+        for f in file_list:
+            yield func(f)
+        return
+    logging.info("Processing %d files with %d processes", len(file_list), jobs)
+    initializer = setup if setup is not None and context is None else None
+    with ProcessPoolExecutor(max_workers=jobs, mp_context=context, initializer=initializer,
+                             initargs=setup_args) as executor:
+        pending = deque()
+        for f in file_list:
+            pending.append(executor.submit(_call_with_stages, func, f))
+            if len(pending) >= 2 * jobs:
+                yield _collect_stages(pending.popleft().result())
+        while pending:
+            yield _collect_stages(pending.popleft().result())
+
+
+def map_files(func, file_list, jobs=1):
+    '''
+    Apply a function to each file, see imap_files.
+
+    Returns
+    -------
+    list
+        the results, in the same order as file_list.
+    '''
+    return list(imap_files(func, file_list, jobs))
+
+
+def iter_json_array(stream, block_size=1 << 20, raw=False):
+    '''
+    Iterate the items of a top level json array without loading the whole document.
+
+    Parameters
+    ----------
+    stream : file object
+        a text stream positioned at the beginning of a json array.
+    block_size : int
+        number of characters read from the stream at a time.
+    raw : bool
+        if True yield the json text of each item instead of the decoded item.
+
+    Returns
+    -------
+    generator
+        the decoded items (or their text) of the array, one at a time.
+    '''
+    decoder = json.JSONDecoder()
+    buffer = ""
+    eof = False
+    while not buffer and not eof:
+        block = stream.read(block_size)
+        eof = len(block) == 0
+        buffer = block.lstrip()
+    if not buffer.startswith("["):
+        raise ValueError("Expecting a json array")
+    pos = 1
+    while True:
+        # skip white spaces and delimiters between items
+        while pos < len(buffer) and buffer[pos] in " \t\n\r,":
+            pos += 1
+        if pos < len(buffer) and buffer[pos] == "]":
+            return
+        try:
+            item, end = decoder.raw_decode(buffer, pos)
+            # an item touching the end of the buffer may continue in the next block, so may a number
+            # cut before its fraction or exponent (e.g. 1. or 1e-)
+            complete = eof or (end < len(buffer) and buffer[end] not in ".eE+-")
+        except json.JSONDecodeError:
+            if eof:
+                raise
+            complete = False
+        if complete:
+            yield buffer[pos:end] if raw else item
+            pos = end
+        else:
+            # keep the unparsed tail and append the next block
+            block = stream.read(block_size)
+            eof = len(block) == 0
+            buffer = buffer[pos:] + block
+            pos = 0
@@ -0,0 +1,78 @@
+import re
+
+import numpy as np
+import pytest
+
+from cs_string import OP_DEL, OP_INS, OP_MATCH, OP_SBS, operation_bases, parse_cs
+
+CS_TOKEN = re.compile(r":([0-9]+)|=([A-Za-z]+)|\*([a-z])([a-z])|\+([a-z]+)|-([a-z]+)")
+
+
+def reference_ops(strings):
+    '''
+    Operations of the cs strings read token by token with a regular expression.
+    '''
+    ops = list()
+    for read, cs in enumerate(strings):
+        offset, ref_offset = 0, 0
+        for m in CS_TOKEN.finditer(cs):
+            if m.group(1) is not None:
+                op, length, ref, alt = OP_MATCH, int(m.group(1)), 0, 0
+            elif m.group(2) is not None:
+                op, length, ref, alt = OP_MATCH, len(m.group(2)), 0, 0
+            elif m.group(3) is not None:
+                op, length, ref, alt = OP_SBS, 1, ord(m.group(3).upper()), ord(m.group(4).upper())
+            elif m.group(5) is not None:
+                op, length, ref, alt = OP_INS, len(m.group(5)), 0, ord(m.group(5)[0].upper())
+            else:
+                op, length, ref, alt = OP_DEL, len(m.group(6)), ord(m.group(6)[0].upper()), 0
+            ops.append((read, op, length, ref, alt, offset, ref_offset))
+            offset += 0 if op == OP_DEL else length
+            ref_offset += 0 if op == OP_INS else length
+    return ops
+
+
+def random_cs(rng):
+    tokens = list()
+    for _ in range(rng.integers(1, 12)):
+        kind = rng.integers(5)
+        bases = "".join(rng.choice(list("acgtn"), rng.integers(1, 5)))
+        if kind == 0:
+            tokens.append(":%d" % rng.integers(1, 2000))
+        elif kind == 1:
+            tokens.append("=" + bases.upper())
+        elif kind == 2:
+            tokens.append("*" + "".join(rng.choice(list("acgtn"), 2)))
+        elif kind == 3:
+            tokens.append("+" + bases)
+        else:
+            tokens.append("-" + bases)
+    return "".join(tokens)
+
+
+def test_parse_cs_matches_the_reference():
+    rng = np.random.default_rng(0)
+    for _ in range(50):
+        strings = [random_cs(rng) for _ in range(rng.integers(1, 20))]
+        ops = parse_cs(strings)
+        assert list(zip(*[v.tolist() for v in ops])) == reference_ops(strings)
+
+
+def test_operation_bases():
+    ops = parse_cs([":5*gt:2+aa", "-acg:10"])
+    bases = operation_bases(ops, 3)
+    assert bases["match"].tolist() == [7, 10, 0]
+    assert bases["sbs"].tolist() == [1, 0, 0]
+    assert bases["ins"].tolist() == [2, 0, 0]
+    assert bases["del"].tolist() == [0, 3, 0]
+
+
+def test_parse_cs_empty():
+    ops = parse_cs([])
+    assert all(len(v) == 0 for v in ops)
+
+
+@pytest.mark.parametrize("cs", [":5~gt10ag:3", "5*gt", ":", ":5*", ":a5", ":5*g", ":5*gta", ":5+"])
+def test_parse_cs_rejects_malformed_strings(cs):
+    with pytest.raises(ValueError):
+        parse_cs([cs])
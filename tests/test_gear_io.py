@@ -0,0 +1,39 @@
+import gzip
+import json
+
+import pytest
+
+from gear_io import blocked_file, read_array_block, read_block_index, write_blocked_array
+
+
+def write_output(path, items):
+    with gzip.open(path, "wt") as f:
+        json.dump(items, f)
+
+
+@pytest.mark.parametrize("n_items, block_items", [(0, 3), (1, 3), (2, 3), (6, 3), (7, 3), (5, 1)])
+def test_blocks_read_back_the_array(tmp_path, n_items, block_items):
+    path = str(tmp_path / "output.json.gz")
+    items = [{"name": "read%d" % i, "sbs": {str(i): [{"value": "A"}]}, "seq": "ACGT" * i} for i in range(n_items)]
+    write_output(path, items)
+    with open(path, "rb") as f:
+        original = f.read()
+
+    blocks = write_blocked_array(path, block_items=block_items)
+    assert read_block_index(path) == [tuple(b) for b in blocks]
+    assert [item for block in blocks for item in read_array_block(path, block)] == items
+    assert [b[2] for b in blocks if b[2] > 0] == [min(block_items, n_items - i)
+                                                 for i in range(0, n_items, block_items)]
+    # the copy is a valid json array and the output is unchanged
+    with gzip.open(blocked_file(path), "rt") as f:
+        assert json.load(f) == items
+    with open(path, "rb") as f:
+        assert f.read() == original
+
+
+def test_outdated_index_is_ignored(tmp_path):
+    path = str(tmp_path / "output.json.gz")
+    write_output(path, [{"name": "a"}, {"name": "b"}])
+    write_blocked_array(path, block_items=1)
+    write_output(path, [{"name": "a"}, {"name": "b"}, {"name": "a much longer read name"}])
+    assert read_block_index(path) is None
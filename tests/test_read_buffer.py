@@ -0,0 +1,37 @@
+import numpy as np
+
+from read_buffer import PackedBases, decode_reads, decode_strings, pack_bases, unpack_bases
+
+
+def test_pack_bases_round_trip():
+    rng = np.random.default_rng(0)
+    # lengths that are and are not multiples of 4, an empty read, and N / lower case bases
+    seq = ["".join(rng.choice(list("ACGTNacgt"), n)) for n in [0, 1, 3, 4, 7, 150, 151]]
+    matrix, lengths = decode_strings(seq)
+    packed = pack_bases(matrix, lengths)
+    assert isinstance(packed, PackedBases)
+    assert packed.codes.shape == (len(seq), (matrix.shape[1] + 3) // 4)
+
+    unpacked = unpack_bases(packed)
+    expected = [s.upper() for s in seq]
+    for row, (s, n) in enumerate(zip(expected, lengths)):
+        assert unpacked[row, :n].tobytes().decode("ascii") == s
+        # the padding after the end of each read is restored as zeros
+        assert not unpacked[row, n:].any()
+
+
+def test_pack_bases_without_padding():
+    seq = ["ACGTN", "TTGCA"]
+    matrix, lengths = decode_strings(seq)
+    assert unpack_bases(pack_bases(matrix, lengths)).tobytes() == b"ACGTNTTGCA"
+
+
+def test_pack_bases_empty_batch():
+    matrix, lengths = decode_strings([])
+    assert unpack_bases(pack_bases(matrix, lengths)).shape == (0, 0)
+
+
+def test_decode_reads_pads_the_quality_scores():
+    batch = decode_reads(["ACG", "A"], ["I#!", "5"])
+    assert batch.lengths.tolist() == [3, 1]
+    assert batch.qv.tolist() == [[40, 2, 0], [20, 0, 0]]
@@ -0,0 +1,34 @@
+import io
+import json
+
+import pytest
+
+from utils import iter_json_array
+
+ITEMS = [{"name": "read1", "sbs": {"5": [{"value": "A", "mean_qv": 30.5}]}}, [1, 2, [3]], "a ] string, with [ brackets",
+         12, -0.5, None, True, {}]
+
+
+@pytest.mark.parametrize("block_size", [1, 3, 1 << 20])
+@pytest.mark.parametrize("text", [json.dumps(ITEMS), json.dumps(ITEMS, indent=2), "\n " + json.dumps(ITEMS) + "\n"])
+def test_iter_json_array_blocks(text, block_size):
+    assert list(iter_json_array(io.StringIO(text), block_size=block_size)) == ITEMS
+
+
+@pytest.mark.parametrize("block_size", [1, 3])
+def test_iter_json_array_raw(block_size):
+    text = json.dumps(ITEMS)
+    raw = list(iter_json_array(io.StringIO(text), block_size=block_size, raw=True))
+    assert [json.loads(r) for r in raw] == ITEMS
+
+
+@pytest.mark.parametrize("block_size", [1, 3])
+@pytest.mark.parametrize("text", ["[]", " [ ] ", "[\n]\n"])
+def test_iter_json_array_empty(text, block_size):
+    assert list(iter_json_array(io.StringIO(text), block_size=block_size)) == []
+
+
+@pytest.mark.parametrize("text", ["{}", "", "[1, 2", "[1, {\"a\": ]"])
+def test_iter_json_array_rejects_other_documents(text):
+    with pytest.raises(ValueError):
+        list(iter_json_array(io.StringIO(text), block_size=3))